@@ -1,13 +1,275 @@
+import argparse
 import configparser
 import logging
+import os
 import sys
+import time
+from datetime import datetime
+from typing import Callable, Iterator
 
-from custom_requests.zap import ZapRequest
-from kmz.kmz import KMZ
+from misc.metrics import metrics
+
+## the other modules are imported by the commands that use them: render and export never load curl_cffi
+## and the crawler, and the profilers are only loaded with --profile
 
 logger = logging.getLogger(__name__)
 
+
+## the [ZAP] and [FILTERS_KMZ] sections of a search, overridden by [ZAP.<name>] and [FILTERS_KMZ.<name>]
+def get_search_configs(config: configparser.RawConfigParser, name: str = '') -> tuple[dict, dict]:
+    if not name:
+        return dict(config['ZAP']), dict(config['FILTERS_KMZ'])
+    if not config.has_section(f'ZAP.{name}'):
+        logger.error(f'Section [ZAP.{name}] not found for search "{name}"')
+        raise Exception(f'Section [ZAP.{name}] not found for search "{name}"')
+    zap_configs = {**config['ZAP'], **config[f'ZAP.{name}']}
+    filters_kmz = dict(config['FILTERS_KMZ'])
+    if config.has_section(f'FILTERS_KMZ.{name}'):
+        filters_kmz.update(config[f'FILTERS_KMZ.{name}'])
+    return zap_configs, filters_kmz
+
+
+## each name in [ZAP] searches is a search whose [ZAP.<name>] and [FILTERS_KMZ.<name>] sections
+## override the base [ZAP] and [FILTERS_KMZ] sections
+def get_searches(config: configparser.RawConfigParser) -> list[tuple[str, dict, dict]]:
+    return [(name, *get_search_configs(config, name))
+            for name in [name.strip() for name in config['ZAP'].get('searches', '').split(',') if name.strip()]]
+
+
+## each name in [UTILITY] profiles is a filter profile whose [PROFILE.<name>] section overrides the filters
+## of the search, all profiles are evaluated against the listings of one crawl
+def get_profiles(config: configparser.RawConfigParser, filters_kmz: dict) -> list[tuple[str, dict]]:
+    profiles = []
+    for name in [name.strip() for name in config['UTILITY'].get('profiles', '').split(',') if name.strip()]:
+        if not config.has_section(f'PROFILE.{name}'):
+            logger.error(f'Section [PROFILE.{name}] not found for profile "{name}"')
+            raise Exception(f'Section [PROFILE.{name}] not found for profile "{name}"')
+        profiles.append((name, {**filters_kmz, **config[f'PROFILE.{name}']}))
+    return profiles
+
+
+def render_profiles(pages: Iterator[list], zap_configs, utilities, profiles: list[tuple[str, dict]], prefix: str = 'rentMap'):
+    from kmz.profiles import ProfileRenderer
+
+    profile_renderer = ProfileRenderer(zap_configs, utilities, profiles, prefix, int(utilities.get('profile_workers', '0')))
+    profile_renderer.render(pages)
+
+
+def run_batch(config: configparser.RawConfigParser, utilities, poi_index):
+    from custom_requests.zap import ZapRequest
+    from custom_requests.zap_session import ZapSession
+    from kmz.kmz import KMZ
+    from misc.save_data import SaveData
+
+    searches = get_searches(config)
+    for name, _, _ in searches:
+        session_keys = [key for key in ZapSession.config_keys if config.has_option(f'ZAP.{name}', key)]
+        if session_keys:
+            logger.error(f'{", ".join(session_keys)} cannot be set in [ZAP.{name}], the searches of a batch share '
+                         f'the session of [ZAP]')
+            raise Exception(f'{", ".join(session_keys)} cannot be set in [ZAP.{name}]')
+    zap_session = ZapSession(config['ZAP'])
+    listing_cache = {}
+    formatted_now = datetime.now().strftime("%Y%m%d-%H%M%S")
+    for name, zap_configs, filters_kmz in searches:
+        logger.info(f'Running search "{name}"')
+        zap_api = ZapRequest(zap_configs, filters_kmz, poi_index=poi_index, zap_session=zap_session,
+                             listing_cache=listing_cache, save_data=SaveData(f'{formatted_now}/{name}'),
+                             search_name=name)
+        profiles = get_profiles(config, filters_kmz)
+        if profiles:
+            render_profiles(zap_api.iter_pages(), zap_configs, utilities, profiles, prefix=f'rentMap_{name}')
+            continue
+        kmz = KMZ(zap_api.iter_filtered_listings(), zap_configs, utilities, destination=f'rentMap_{name}.kmz')
+        kmz.process_listings()
+    logger.info(f'Batch of {len(searches)} searches finished with {len(listing_cache)} distinct listings')
+    zap_session.close()
+
+
+def run(config: configparser.RawConfigParser):
+    from custom_requests.zap import ZapRequest
+    from kmz.kmz import KMZ
+    from misc.spatial_index import PoiIndex
+
+    zap_configs = config['ZAP']
+    filters_kmz = config['FILTERS_KMZ']
+    utilities = config['UTILITY']
+    poi_index = PoiIndex.from_config(utilities)
+    if zap_configs.get('searches', '').strip():
+        run_batch(config, utilities, poi_index)
+        return
+    zap_api = ZapRequest(zap_configs, filters_kmz, poi_index=poi_index)
+    profiles = get_profiles(config, dict(filters_kmz))
+    if profiles:
+        render_profiles(zap_api.iter_pages(), zap_configs, utilities, profiles)
+        return
+    zap_listings = zap_api.iter_filtered_listings()
+
+    kmz = KMZ(zap_listings, zap_configs, utilities)
+    kmz.process_listings()
+
+
+## the listings of a saved snapshot, annotated with the POIs of the current [UTILITY] section
+def iter_snapshot_pages(config: configparser.RawConfigParser, snapshot_path: str | None, search_name: str) -> Iterator[list]:
+    from misc.snapshot import Snapshot
+    from misc.spatial_index import PoiIndex
+
+    snapshot = Snapshot(snapshot_path) if snapshot_path else Snapshot.find_latest(search_name=search_name)
+    logger.info(f'Reading listings from snapshot {snapshot.path}, without network access')
+    poi_index = PoiIndex.from_config(config['UTILITY'])
+    for page in snapshot.iter_pages():
+        if poi_index is not None:
+            with metrics.timer('poi'):
+                poi_index.annotate(page)
+        yield page
+
+
+## rebuilds the KMZ of a snapshot with the current filters and utilities, or the KMZ and CSV of each profile
+def render(config: configparser.RawConfigParser, snapshot_path: str | None, search_name: str, destination: str):
+    from kmz.kmz import KMZ
+    from misc.filter_engine import FilterEngine
+
+    zap_configs, filters_kmz = get_search_configs(config, search_name)
+    profiles = get_profiles(config, filters_kmz)
+    if profiles:
+        prefix = os.path.splitext(destination)[0]
+        render_profiles(iter_snapshot_pages(config, snapshot_path, search_name), zap_configs, config['UTILITY'], profiles,
+                        prefix)
+        return
+    pages = FilterEngine(filters_kmz).filter_pages(iter_snapshot_pages(config, snapshot_path, search_name))
+    kmz = KMZ((listing for page in pages for listing in page), zap_configs, config['UTILITY'], destination=destination)
+    kmz.process_listings()
+
+
+## writes the listings of a snapshot that pass the current filters to a CSV file
+def export(config: configparser.RawConfigParser, snapshot_path: str | None, search_name: str, destination: str):
+    from misc.filter_engine import FilterEngine
+    from model.listing_model import Listing
+
+    zap_configs, filters_kmz = get_search_configs(config, search_name)
+    pages = FilterEngine(filters_kmz).filter_pages(iter_snapshot_pages(config, snapshot_path, search_name))
+    n_listings = 0
+    try:
+        with open(f'{destination}.tmp', 'w', encoding='utf-8') as file:
+            file.write(Listing.get_csv_headers() + '\n')
+            for page in pages:
+                for listing in page:
+                    line = listing.get_csv_line(zap_configs['base_url'])
+                    if line is not None:
+                        file.write(line + '\n')
+                        n_listings += 1
+    except BaseException:
+        os.remove(f'{destination}.tmp')
+        raise
+    os.replace(f'{destination}.tmp', destination)
+    logger.info(f'The CSV file "{destination}" has been saved successfully with {n_listings} listings')
+
+
+## polls the search every watch_interval_minutes and serves the map over HTTP until interrupted
+def watch(config: configparser.RawConfigParser, search_name: str, interval_minutes: float | None):
+    from custom_requests.zap import ZapRequest
+    from custom_requests.zap_session import ZapSession
+    from kmz.kmz import KMZ
+    from kmz.watch_map import WatchMap, WatchServer
+    from misc.save_data import SaveData
+    from misc.spatial_index import PoiIndex
+
+    zap_configs, filters_kmz = get_search_configs(config, search_name)
+    ## every poll has to reach the API, a cached response would hide the changes
+    zap_configs['cache_responses'] = 'False'
+    ## the checkpoint of a finished crawl is removed, every poll starts from page 1
+    zap_configs['checkpoint'] = 'False'
+    utilities = config['UTILITY']
+    ## without watch_save_snapshots, a long watch would fill data/ with near-identical folders
+    save_snapshots = utilities.get('watch_save_snapshots', 'False') == 'True'
+    if not save_snapshots:
+        for key in ('save_json_listings', 'save_csv_listings', 'save_jsonl_listings', 'save_columnar_listings'):
+            zap_configs[key] = 'False'
+    if interval_minutes is None:
+        interval_minutes = float(utilities.get('watch_interval_minutes', '60'))
+    poi_index = PoiIndex.from_config(utilities)
+    zap_session = ZapSession(zap_configs)
+    ## one ZapRequest for the whole watch, so the listing and history stores are opened once
+    zap_api = ZapRequest(zap_configs, filters_kmz, poi_index=poi_index, zap_session=zap_session, search_name=search_name)
+    watch_map = WatchMap(KMZ([], zap_configs, utilities), int(utilities.get('watch_documents', '16')),
+                         int(utilities.get('watch_refresh_seconds', '60')))
+    server = WatchServer(watch_map, utilities.get('watch_host', '127.0.0.1'), int(utilities.get('watch_port', '8080')))
+    server.start()
+    try:
+        while True:
+            start = time.monotonic()
+            try:
+                if save_snapshots:
+                    zap_api.save_data = SaveData()
+                watch_map.update(zap_api.iter_filtered_listings())
+            except Exception:
+                ## the map keeps the listings of the last successful poll
+                logger.exception('Poll failed, the map was not updated')
+            metrics.log_summary()
+            time.sleep(max(interval_minutes * 60 - (time.monotonic() - start), 0))
+    except KeyboardInterrupt:
+        logger.info('Watch mode stopped')
+    finally:
+        server.shutdown()
+        server.server_close()
+        zap_session.close()
+
+
+## cprofile dumps profile.prof (open it with pstats or snakeviz), tracemalloc dumps tracemalloc.snapshot
+def run_profiled(command: Callable[[], None], profile: str):
+    if profile == 'cprofile':
+        import cProfile
+        import io
+        import pstats
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            command()
+        finally:
+            profiler.disable()
+            profiler.dump_stats('profile.prof')
+            stream = io.StringIO()
+            pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(30)
+            logger.info(f'cProfile stats written to profile.prof\n{stream.getvalue()}')
+    else:
+        import tracemalloc
+
+        tracemalloc.start(25)
+        try:
+            command()
+        finally:
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            snapshot.dump('tracemalloc.snapshot')
+            top_allocations = '\n'.join(str(statistic) for statistic in snapshot.statistics('lineno')[:25])
+            logger.info(f'tracemalloc snapshot written to tracemalloc.snapshot - peak traced memory: '
+                        f'{peak / 1024 / 1024:.1f} MiB, largest allocations still alive:\n{top_allocations}')
+
+
 def main():
+    parser = argparse.ArgumentParser(description='Builds a KMZ map of the rental listings of a ZAP Imóveis search')
+    parser.add_argument('--profile', choices=('cprofile', 'tracemalloc'), default=None,
+                        help='profile the run with cProfile or tracemalloc')
+    subparsers = parser.add_subparsers(dest='command')
+    fetch_parser = subparsers.add_parser('fetch', help='search the ZAP API, save the listings and build the KMZ (default)')
+    fetch_parser.add_argument('--resume', action='store_true', help='continue the crawl interrupted in the last run')
+    for name, help_text, extension in [
+        ('render', 'rebuild the KMZ from a saved snapshot, without network access', 'kmz'),
+        ('export', 'write the filtered listings of a saved snapshot to a CSV file, without network access', 'csv'),
+    ]:
+        subparser = subparsers.add_parser(name, help=help_text)
+        subparser.add_argument('--snapshot', default=None,
+                               help='snapshot folder, e.g. data/20250101-120000 (default: the most recent one)')
+        subparser.add_argument('--search', default='', help='search of a batch run, for its filters and snapshots')
+        subparser.add_argument('--output', default=None, help=f'output file (default: rentMap.{extension})')
+    watch_parser = subparsers.add_parser('watch', help='poll the search on a schedule and serve the map to Google Earth')
+    watch_parser.add_argument('--interval', type=float, default=None,
+                              help='minutes between polls (default: watch_interval_minutes)')
+    watch_parser.add_argument('--search', default='', help='search of a batch run to watch')
+    args = parser.parse_args()
+
     logging.basicConfig(
         handlers=[
             logging.StreamHandler(sys.stdout),
@@ -20,15 +282,27 @@ def main():
     config = configparser.RawConfigParser()
     config.read('config.ini')
 
-    zap_configs = config['ZAP']
-    filters_kmz = config['FILTERS_KMZ']
-    zap_api = ZapRequest(zap_configs, filters_kmz)
-    zap_listings = zap_api.get_all()
-
     utilities = config['UTILITY']
-    kmz = KMZ(zap_listings, zap_configs, utilities)
-    kmz.process_listings()
+    if getattr(args, 'resume', False):
+        config['ZAP']['resume'] = 'True'
+    if args.command in ('render', 'export'):
+        extension = 'kmz' if args.command == 'render' else 'csv'
+        destination = args.output or (f'rentMap_{args.search}.{extension}' if args.search else f'rentMap.{extension}')
+        command = {'render': render, 'export': export}[args.command]
+        run_command = lambda: command(config, args.snapshot, args.search, destination)
+    elif args.command == 'watch':
+        run_command = lambda: watch(config, args.search, args.interval)
+    else:
+        run_command = lambda: run(config)
+    try:
+        if args.profile is not None:
+            run_profiled(run_command, args.profile)
+        else:
+            run_command()
+    finally:
+        metrics.log_summary()
+        metrics.write(utilities.get('metrics_json', 'metrics.json'), utilities.get('metrics_prometheus', ''))
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
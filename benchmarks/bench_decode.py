@@ -0,0 +1,80 @@
+import argparse
+import json
+import time
+
+from benchmarks import baseline_listing_model
+from benchmarks.synthetic import generate_page
+from pydantic import TypeAdapter
+
+from model.listing_model import Listing, search_response_adapter
+
+listings_adapter = TypeAdapter(list[Listing])
+
+
+## the decode of the sequential crawler, over models without slots that filter pricingInfos on every read
+def run_baseline(content: bytes) -> list[baseline_listing_model.Listing]:
+    response = json.loads(content)
+    return [baseline_listing_model.Listing(**listing) for listing in response['search']['result']['listings']]
+
+
+def run_per_record(content: bytes) -> list[Listing]:
+    response = json.loads(content)
+    return [Listing(**listing) for listing in response['search']['result']['listings']]
+
+
+def run_batch(content: bytes) -> list[Listing]:
+    response = json.loads(content)
+    return listings_adapter.validate_python(response['search']['result']['listings'])
+
+
+def run_from_bytes(content: bytes) -> list[Listing]:
+    return search_response_adapter.validate_json(content).search.result.listings
+
+
+def run_from_bytes_with_raw(content: bytes) -> list[Listing]:
+    json.loads(content)
+    return search_response_adapter.validate_json(content).search.result.listings
+
+
+def run_csv_lines(listings: list):
+    for listing in listings:
+        listing.get_csv_line('https://www.zapimoveis.com.br')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compares the listing decode paths used by ZapRequest')
+    parser.add_argument('--pages', type=int, default=20)
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    n_listings = args.pages * args.page_size
+    pages = [json.dumps(generate_page(page_number, args.page_size, n_listings)).encode('utf-8')
+             for page_number in range(1, args.pages + 1)]
+    n_bytes = sum(len(page) for page in pages)
+    print(f'{n_listings} listings in {args.pages} pages ({n_bytes / 1024 / 1024:.1f} MiB)')
+
+    baseline_seconds = None
+    for name, decode in [
+        ('baseline: json.loads + unslotted models', run_baseline),
+        ('json.loads + Listing(**listing)', run_per_record),
+        ('json.loads + TypeAdapter batch', run_batch),
+        ('TypeAdapter.validate_json (bytes)', run_from_bytes),
+        ('validate_json + json.loads (raw kept)', run_from_bytes_with_raw),
+    ]:
+        best = float('inf')
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            listings = [listing for page in pages for listing in decode(page)]
+            best = min(best, time.perf_counter() - start)
+        start = time.perf_counter()
+        run_csv_lines(listings)
+        csv_seconds = time.perf_counter() - start
+        ## decode and CSV lines together, compared with the baseline
+        if baseline_seconds is None:
+            baseline_seconds = best + csv_seconds
+        print(f'{name:<40} {best * 1000:8.1f} ms  {n_listings / best:10.0f} listings/s  '
+              f'(CSV lines: {csv_seconds * 1000:.1f} ms)  {baseline_seconds / (best + csv_seconds):5.2f}x baseline')
+
+if __name__ == '__main__':
+    main()
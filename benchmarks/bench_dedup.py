@@ -0,0 +1,51 @@
+import argparse
+import copy
+import random
+import time
+
+from benchmarks.synthetic import generate_listing
+from misc.deduplication import ListingDeduplicator
+from model.listing_model import Listing
+
+
+## republishes a share of the listings as other advertisers would: new id, link and price, one word changed
+def generate_duplicates(listings: list[dict], share: float, seed: int = 0) -> dict[str, str]:
+    rng = random.Random(seed)
+    duplicates = {}
+    for index in rng.sample(range(len(listings)), int(len(listings) * share)):
+        duplicate = copy.deepcopy(listings[index])
+        duplicate['listing']['id'] = f'duplicate-{index}'
+        duplicate['link']['href'] = f'/imovel/duplicate-{index}'
+        duplicate['account']['name'] = f'Outra imobiliária {index}'
+        duplicate['listing']['pricingInfos'][0]['price'] = str(int(duplicate['listing']['pricingInfos'][0]['price']) + 100)
+        words = duplicate['listing']['description'].split()
+        words[rng.randrange(len(words))] = 'reformado'
+        duplicate['listing']['description'] = ' '.join(words)
+        listings.append(duplicate)
+        duplicates[duplicate['listing']['id']] = listings[index]['listing']['id']
+    return duplicates
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Times MinHash/LSH deduplication on synthetic listings with known duplicates')
+    parser.add_argument('--listings', type=int, default=100_000)
+    parser.add_argument('--duplicate-share', type=float, default=0.02)
+    parser.add_argument('--threshold', type=float, default=0.5)
+    args = parser.parse_args()
+
+    raw_listings = [generate_listing(index) for index in range(args.listings)]
+    duplicates = generate_duplicates(raw_listings, args.duplicate_share)
+    listings = [Listing(**listing) for listing in raw_listings]
+
+    start = time.perf_counter()
+    keep = ListingDeduplicator(args.threshold).deduplicate(listings)
+    elapsed = time.perf_counter() - start
+    removed = {listing.listing.id for listing, keep_listing in zip(listings, keep) if not keep_listing}
+    print(f'{len(listings)} listings deduplicated in {elapsed:.2f} s')
+    ## ads with an approximated address are never compared, so not every duplicate can be found
+    print(f'{len(removed & duplicates.keys())} of {len(duplicates)} duplicates removed, '
+          f'{len(removed - duplicates.keys())} other listings removed')
+
+
+if __name__ == '__main__':
+    main()
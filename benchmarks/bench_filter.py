@@ -0,0 +1,46 @@
+import argparse
+import time
+
+from benchmarks.synthetic import generate_listing
+from misc.filter_engine import FilterEngine
+from model.listing_model import Listing
+from model.listing_table import ListingTable
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Times the filter engine on streamed pages and on a columnar listing table')
+    parser.add_argument('--listings', type=int, default=100_000)
+    parser.add_argument('--page-size', type=int, default=100)
+    args = parser.parse_args()
+
+    listings = [Listing(**generate_listing(index)) for index in range(args.listings)]
+    start = time.perf_counter()
+    table = ListingTable.from_listings(listings)
+    print(f'ListingTable with {len(table)} rows built in {(time.perf_counter() - start) * 1000:.1f} ms')
+
+    for filters in [
+        {'rent_price_min': '2000', 'rent_price_max': '4000', 'pets_allowed': 'True', 'min_unit_floor': '5'},
+        {'rent_price_max': '5000', 'neighborhood': 'Boa Viagem', 'area_min': '60', 'bedrooms_min': '2'},
+        {'total_cost_max': '4500', 'bedrooms_min': '2', 'bedrooms_max': '3'},
+    ]:
+        filter_engine = FilterEngine(filters)
+        start = time.perf_counter()
+        mask = filter_engine.get_mask(table)
+        elapsed = time.perf_counter() - start
+        print(f'{mask.sum():7d} of {len(table)} listings kept in {elapsed * 1000:6.2f} ms - {filters}')
+
+        ## the streaming stage filters each page once, with and without building its ListingTable
+        pages = [listings[start:start + args.page_size] for start in range(0, len(listings), args.page_size)]
+        start = time.perf_counter()
+        n_kept = sum(len(filter_engine.filter_listings(page)) for page in pages)
+        listing_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        n_kept_table = sum(int(filter_engine.get_mask(ListingTable.from_listings(page)).sum()) for page in pages)
+        table_seconds = time.perf_counter() - start
+        assert n_kept == n_kept_table == mask.sum()
+        print(f'        pages of {args.page_size}: per listing {listing_seconds * 1000:7.1f} ms, '
+              f'ListingTable per page {table_seconds * 1000:7.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.synthetic import generate_listing
+from model.listing_model import Listing
+
+ICON = Listing.kml_icon
+ICON_COLOR = Listing.kml_icon_color
+
+
+def get_points(n_points: int) -> list[tuple[float, float, str]]:
+    points = []
+    for index in range(n_points):
+        listing = generate_listing(index)['listing']
+        point = listing['address']['point']
+        points.append((point['approximateLat'], point['approximateLon'], listing['description']))
+    return points
+
+
+def write_simplekml(points: list[tuple[float, float, str]], destination: str):
+    import simplekml
+    kml = simplekml.Kml(open=1, name='RentMap')
+    for lat, lon, description in points:
+        point = kml.newpoint(name='', coords=[(lon, lat)], description=description)
+        point.iconstyle.icon.href = ICON
+        point.iconstyle.color = ICON_COLOR
+        point.iconstyle.scale = 1.0
+        point.style.labelstyle.scale = 0.8
+    kml.savekmz(destination)
+
+
+def write_kml_writer(points: list[tuple[float, float, str]], destination: str):
+    from kmz.kml_writer import KmlWriter
+    kml = KmlWriter(destination)
+    style_id = kml.get_style_id(ICON, ICON_COLOR)
+    for lat, lon, description in points:
+        kml.add_placemark(lat, lon, '', description, style_id)
+    kml.close()
+
+
+## runs one writer in this process and prints its measurements as JSON, so that peak RSS is not shared
+def run_child(writer: str, n_points: int):
+    points = get_points(n_points)
+    baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    with tempfile.TemporaryDirectory() as directory:
+        destination = os.path.join(directory, 'bench.kmz')
+        start = time.perf_counter()
+        {'simplekml': write_simplekml, 'KmlWriter': write_kml_writer}[writer](points, destination)
+        elapsed = time.perf_counter() - start
+        size = os.path.getsize(destination)
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({'seconds': elapsed, 'size': size, 'rss_growth_kb': peak_rss - baseline_rss, 'peak_rss_kb': peak_rss}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compares simplekml against the streaming KmlWriter')
+    parser.add_argument('--points', type=int, nargs='+', default=[10_000, 100_000])
+    parser.add_argument('--child', nargs=2, metavar=('WRITER', 'POINTS'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        run_child(args.child[0], int(args.child[1]))
+        return
+
+    print(f'{"points":>8} {"writer":<10} {"time (s)":>9} {"RSS growth (MiB)":>17} {"peak RSS (MiB)":>15} {"KMZ (KiB)":>10}')
+    for n_points in args.points:
+        for writer in ('simplekml', 'KmlWriter'):
+            output = subprocess.run([sys.executable, '-m', 'benchmarks.bench_kml', '--child', writer, str(n_points)],
+                                    check=True, capture_output=True, text=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(f'{n_points:>8} {writer:<10} {result["seconds"]:>9.2f} {result["rss_growth_kb"] / 1024:>17.1f} '
+                  f'{result["peak_rss_kb"] / 1024:>15.1f} {result["size"] / 1024:>10.0f}')
+
+
+if __name__ == '__main__':
+    main()
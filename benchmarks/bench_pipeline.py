@@ -0,0 +1,97 @@
+import argparse
+import configparser
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.stub_server import StubGlueApi
+
+
+## the repository config.ini pointed at the stub, with the rate limit and the response cache out of the way
+def write_config(source: str, destination: str, server: StubGlueApi, args: argparse.Namespace):
+    config = configparser.RawConfigParser()
+    config.read(source)
+    config['ZAP'].update({
+        'base_url': server.base_url,
+        'data_api': server.data_api,
+        'max_concurrent_requests': str(args.concurrency),
+        'requests_per_second': '1000000',
+        'cache_responses': 'False',
+        'offline': 'False',
+        'incremental': 'False',
+        'sharding': 'False',
+        'searches': '',
+        'save_csv_listings': str(args.save),
+        'save_json_listings': str(args.save),
+        'field_projection': str(args.field_projection),
+    })
+    config['UTILITY']['metrics_json'] = 'metrics.json'
+    config['UTILITY']['metrics_prometheus'] = ''
+    with open(destination, 'w', encoding='utf-8') as file:
+        config.write(file)
+
+
+## runs app.run in this process from the given folder and prints its measurements as JSON, so that peak RSS
+## is measured without the stub server
+def run_child(directory: str):
+    os.chdir(directory)
+    logging.basicConfig(filename='Logs.log', level=logging.INFO,
+                        format='%(asctime)s [%(levelname)s] (%(filename)s:%(lineno)d) - %(message)s')
+    import app
+    from misc.metrics import metrics
+    config = configparser.RawConfigParser()
+    config.read('config.ini')
+    start = time.perf_counter()
+    app.run(config)
+    elapsed = time.perf_counter() - start
+    stages = {dict(labels)['stage']: value for (name, labels), value in metrics.counters.items() if name == 'stage_seconds'}
+    print(json.dumps({
+        'seconds': elapsed,
+        'listings': metrics.get('listings_parsed_total'),
+        'placemarks': metrics.get('placemarks_written_total'),
+        'stages': stages,
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Runs the whole pipeline against a local stub of the glue-api')
+    parser.add_argument('--listings', type=int, nargs='+', default=[1_000, 10_000])
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--no-save', dest='save', action='store_false', help='skip the CSV and JSON files')
+    parser.add_argument('--full-fields', dest='field_projection', action='store_false',
+                        help='request every field instead of the field projection')
+    parser.add_argument('--child', metavar='DIRECTORY', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        run_child(args.child)
+        return
+
+    repository = os.getcwd()
+    print(f'{"listings":>9} {"time (s)":>9} {"listings/s":>11} {"MiB served":>11} {"peak RSS (MiB)":>15} {"placemarks":>11}  stages (s)')
+    for n_listings in args.listings:
+        server = StubGlueApi(total_results=n_listings, latency=args.latency_ms / 1000).start()
+        try:
+            with tempfile.TemporaryDirectory() as directory:
+                os.symlink(os.path.join(repository, 'resources'), os.path.join(directory, 'resources'))
+                write_config(os.path.join(repository, 'config.ini'), os.path.join(directory, 'config.ini'), server, args)
+                output = subprocess.run([sys.executable, '-m', 'benchmarks.bench_pipeline', '--child', directory],
+                                        check=True, capture_output=True, text=True).stdout
+        finally:
+            server.shutdown()
+            server.server_close()
+        result = json.loads(output.strip().splitlines()[-1])
+        stages = ', '.join(f'{stage} {seconds:.2f}' for stage, seconds in sorted(result['stages'].items()))
+        print(f'{n_listings:>9} {result["seconds"]:>9.2f} {result["listings"] / result["seconds"]:>11.0f} '
+              f'{server.n_bytes / 1024 / 1024:>11.1f} {result["peak_rss_kb"] / 1024:>15.1f} '
+              f'{int(result["placemarks"]):>11}  {stages}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.synthetic import generate_listing
+from misc.save_data import SaveData
+from model.listing_model import Listing
+
+BASE_URL = 'https://www.zapimoveis.com.br'
+
+
+def save_csv(save_data: SaveData, pages: list[tuple[list[dict], list[Listing]]]):
+    for _, listings in pages:
+        save_data.add_listings_csv(listings, BASE_URL)
+    save_data.save_csv_listings()
+
+
+def save_json(save_data: SaveData, pages: list[tuple[list[dict], list[Listing]]]):
+    for raw_listings, _ in pages:
+        save_data.add_listings_json(raw_listings)
+    save_data.save_json_listings()
+
+
+def save_jsonl(save_data: SaveData, pages: list[tuple[list[dict], list[Listing]]]):
+    for raw_listings, _ in pages:
+        save_data.add_listings_jsonl(raw_listings)
+    save_data.save_jsonl_listings()
+
+
+def save_columnar(save_data: SaveData, pages: list[tuple[list[dict], list[Listing]]]):
+    for _, listings in pages:
+        save_data.add_listings_columnar(listings)
+    save_data.save_columnar_listings()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Times the SaveData writers page by page, as ZapRequest calls them')
+    parser.add_argument('--listings', type=int, default=10_000)
+    parser.add_argument('--page-size', type=int, default=100)
+    args = parser.parse_args()
+
+    raw_listings = [generate_listing(index) for index in range(args.listings)]
+    pages = [(raw_listings[start:start + args.page_size],
+              [Listing(**listing) for listing in raw_listings[start:start + args.page_size]])
+             for start in range(0, args.listings, args.page_size)]
+    print(f'{args.listings} listings in {len(pages)} pages')
+
+    print(f'{"format":<10} {"time (s)":>9} {"listings/s":>11} {"peak traced (MiB)":>18} {"file (MiB)":>11}')
+    with tempfile.TemporaryDirectory() as directory:
+        cwd = os.getcwd()
+        os.chdir(directory)
+        try:
+            for name, file_name, save in [
+                ('csv', 'listings.csv', save_csv),
+                ('json', 'listings.json', save_json),
+                ('jsonl.gz', 'listings.jsonl.gz', save_jsonl),
+                ('npz', 'listings.npz', save_columnar),
+            ]:
+                start = time.perf_counter()
+                save(SaveData(name), pages)
+                elapsed = time.perf_counter() - start
+                ## a second run under tracemalloc, which slows the writers down too much to time them
+                tracemalloc.start()
+                save(SaveData(f'{name}-traced'), pages)
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                size = os.path.getsize(f'data/{name}/{file_name}')
+                print(f'{name:<10} {elapsed:>9.2f} {args.listings / elapsed:>11.0f} {peak / 1024 / 1024:>18.1f} '
+                      f'{size / 1024 / 1024:>11.1f}')
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == '__main__':
+    main()
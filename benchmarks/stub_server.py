@@ -0,0 +1,163 @@
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlparse
+
+from benchmarks.synthetic import generate_page
+
+
+## includeFields as a tree of names, an empty dict meaning the whole value, e.g. 'a(b,c(d)),e'
+## becomes {'a': {'b': {}, 'c': {'d': {}}}, 'e': {}}
+def parse_include_fields(include_fields: str) -> dict:
+    tree = {}
+    stack = [tree]
+    name = ''
+    node = tree
+    for char in include_fields:
+        if char in '(),':
+            if name.strip():
+                node = stack[-1].setdefault(name.strip(), {})
+            if char == '(':
+                stack.append(node)
+            elif char == ')':
+                stack.pop()
+            name = ''
+        else:
+            name += char
+    if name.strip():
+        stack[-1].setdefault(name.strip(), {})
+    return tree
+
+
+def project(value, tree: dict):
+    if not tree:
+        return value
+    if isinstance(value, list):
+        return [project(item, tree) for item in value]
+    if isinstance(value, dict):
+        return {key: project(item, tree[key]) for key, item in value.items() if key in tree}
+    return value
+
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+    server: 'StubGlueApi'
+
+    def log_message(self, format: str, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = dict(parse_qsl(url.query))
+        time.sleep(self.server.latency)
+        if url.path == '/':
+            ## cookie bootstrap done by ZapSession.get_user_id_from_cookies
+            user_id = self.server.new_user_id()
+            self.send_body(b'<html></html>', 'text/html', {'Set-Cookie': f'z_user_id={user_id}; Path=/'})
+        elif url.path == '/v2/listings':
+            if not self.server.accept_user_id(query.get('user')):
+                self.send_body(b'{"message": "unknown user"}', 'application/json', status=401)
+                return
+            if self.server.rng.random() < self.server.error_rate:
+                self.send_body(b'{"message": "unavailable"}', 'application/json', {'Retry-After': '1'}, status=503)
+                return
+            size = int(query.get('size', 30))
+            page_number = int(query.get('from', 0)) // max(size, 1) + 1
+            page = generate_page(page_number, size, self.server.total_results, self.server.seed)
+            if 'includeFields' in query:
+                page = project(page, parse_include_fields(query['includeFields']))
+            self.send_body(json.dumps(page).encode('utf-8'), 'application/json')
+        else:
+            self.send_body(b'', 'text/plain', status=404)
+
+    def send_body(self, body: bytes, content_type: str, headers: dict | None = None, status: int = 200):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.add_response(len(body))
+
+
+## local stand-in for www.zapimoveis.com.br and the glue-api: it serves the z_user_id cookie and paginated
+## synthetic listings, waiting `latency` seconds before every response. Failures can be injected: a share of
+## 503 responses with Retry-After, and z_user_id cookies refused (401) after `user_requests` requests
+class StubGlueApi(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port: int = 0, total_results: int = 10_000, latency: float = 0.0, seed: int = 0,
+                 error_rate: float = 0.0, user_requests: int = 0):
+        super().__init__(('127.0.0.1', port), StubRequestHandler)
+        self.total_results = total_results
+        self.latency = latency
+        self.seed = seed
+        self.error_rate = error_rate
+        self.user_requests = user_requests
+        self.rng = random.Random(seed)
+        self.user_id = None
+        self.n_user_requests = 0
+        self.lock = threading.Lock()
+        self.n_responses = 0
+        self.n_bytes = 0
+
+    @property
+    def base_url(self) -> str:
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+    ## a trimmed version of the search URL in config.ini, the stub only reads user, size, from and includeFields
+    @property
+    def data_api(self) -> str:
+        return (f'{self.base_url}/v2/listings?user=00000000-0000-0000-0000-000000000000&portal=ZAP'
+                f'&categoryPage=RESULT&page=1&from=0&size=30&business=RENTAL&listingType=USED'
+                f'&addressCity=Recife&addressNeighborhood=Boa+Viagem&unitTypes=APARTMENT')
+
+    def new_user_id(self) -> str:
+        with self.lock:
+            self.user_id = f'stub-user-{self.rng.randrange(1 << 32):08x}'
+            self.n_user_requests = 0
+            return self.user_id
+
+    def accept_user_id(self, user_id: str | None) -> bool:
+        with self.lock:
+            if user_id is None or user_id != self.user_id:
+                return False
+            self.n_user_requests += 1
+            return not self.user_requests or self.n_user_requests <= self.user_requests
+
+    def add_response(self, n_bytes: int):
+        with self.lock:
+            self.n_responses += 1
+            self.n_bytes += n_bytes
+
+    def start(self) -> 'StubGlueApi':
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serves synthetic glue-api responses for local benchmarks')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--listings', type=int, default=10_000)
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--error-rate', type=float, default=0, help='share of listing requests answered with 503')
+    parser.add_argument('--user-requests', type=int, default=0,
+                        help='listing requests accepted per z_user_id cookie, 0 for no limit')
+    args = parser.parse_args()
+
+    server = StubGlueApi(args.port, args.listings, args.latency_ms / 1000, args.seed, args.error_rate, args.user_requests)
+    print(f'Serving {args.listings} listings at {server.base_url} (data_api = {server.data_api})')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
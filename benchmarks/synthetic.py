@@ -0,0 +1,99 @@
+import random
+
+NEIGHBORHOODS = [
+    ('Boa Viagem', -8.13173, -34.902409),
+    ('Pina', -8.095195, -34.885816),
+    ('Piedade', -8.189083, -34.919223),
+    ('Setúbal', -8.145, -34.905),
+]
+AMENITIES = ['PETS_ALLOWED', 'POOL', 'GYM', 'ELEVATOR', 'FURNISHED', 'BARBECUE_GRILL', 'PLAYGROUND', 'GATED_COMMUNITY']
+STREETS = ['Avenida Boa Viagem', 'Rua dos Navegantes', 'Rua Ribeiro de Brito', 'Avenida Conselheiro Aguiar']
+
+
+## listing in the shape returned by the glue-api, including fields the models do not read
+def generate_listing(index: int, seed: int = 0) -> dict:
+    rng = random.Random(seed * 1_000_003 + index)
+    neighborhood, lat, lon = rng.choice(NEIGHBORHOODS)
+    approximated = rng.random() < 0.1
+    point_lat = lat + rng.uniform(-0.01, 0.01)
+    point_lon = lon + rng.uniform(-0.01, 0.01)
+    price = rng.randrange(1200, 8000, 50)
+    return {
+        'listing': {
+            'id': str(2_000_000_000 + index),
+            'legacyId': str(index),
+            'portal': 'ZAP',
+            'listingType': 'USED',
+            'contractType': 'REAL_ESTATE',
+            'updatedAt': f'2025-0{rng.randint(1, 9)}-{rng.randint(10, 28)}T{rng.randint(10, 23)}:00:00.000Z',
+            'createdAt': '2024-11-03T14:21:09.000Z',
+            'title': f'Apartamento com {rng.randint(1, 4)} quartos para alugar, {rng.randint(30, 200)}m²',
+            'description': ' '.join(rng.choice(['Excelente', 'apartamento', 'nascente', 'vista', 'mar', 'andar', 'alto',
+                                                'próximo', 'ao', 'shopping', 'com', 'varanda', 'e', 'lazer', 'completo'])
+                                     for _ in range(rng.randint(40, 120))),
+            'amenities': rng.sample(AMENITIES, rng.randint(0, len(AMENITIES))),
+            'usableAreas': [rng.randint(30, 200)],
+            'totalAreas': [rng.randint(30, 250)],
+            'floors': [rng.randint(1, 30)],
+            'unitFloor': rng.randint(0, 30),
+            'unitsOnTheFloor': rng.randint(1, 8),
+            'unitTypes': ['APARTMENT'],
+            'unitSubTypes': [],
+            'usageTypes': ['RESIDENTIAL'],
+            'parkingSpaces': [rng.randint(0, 3)],
+            'suites': [rng.randint(0, 2)],
+            'bathrooms': [rng.randint(1, 4)],
+            'bedrooms': [rng.randint(1, 4)],
+            'whatsappNumber': f'8199{rng.randint(1000000, 9999999)}',
+            'stamps': [],
+            'showPrice': True,
+            'status': 'ACTIVE',
+            'address': {
+                'city': 'Recife',
+                'neighborhood': neighborhood,
+                'street': rng.choice(STREETS),
+                'streetNumber': str(rng.randint(1, 5000)),
+                'stateAcronym': 'PE',
+                'zipCode': '51020000',
+                'country': 'Brasil',
+                'point': {
+                    'lat': 0 if approximated else point_lat,
+                    'lon': 0 if approximated else point_lon,
+                    'approximateLat': point_lat,
+                    'approximateLon': point_lon,
+                    'source': 'GOOGLE',
+                },
+            },
+            'pricingInfos': [{
+                'businessType': 'RENTAL',
+                'price': str(price),
+                'monthlyCondoFee': str(rng.randrange(200, 1500, 10)),
+                'yearlyIptu': str(rng.randrange(0, 3000, 10)),
+                'monthlyRentalTotalPrice': str(price + 500),
+                'rentalInfo': {'period': 'MONTHLY', 'warranties': ['DEPOSIT', 'GUARANTOR']},
+            }],
+        },
+        'account': {
+            'id': f'account-{index % 500}',
+            'name': f'Imobiliária {index % 500}',
+            'licenseNumber': f'{index % 500}-J',
+            'logoUrl': 'https://resizedimgs.zapimoveis.com.br/logo.jpg',
+            'tier': 'diamond',
+            'trustScore': rng.random(),
+        },
+        'medias': [{'url': f'https://resizedimgs.zapimoveis.com.br/{index}/{n}.webp', 'type': 'IMAGE'} for n in range(rng.randint(5, 25))],
+        'link': {'href': f'/imovel/aluguel-apartamento-recife-pe-{index}/', 'rel': '', 'data': {'city': 'Recife'}},
+        'accountLink': {'href': f'/imobiliaria/{index % 500}/'},
+    }
+
+
+def generate_page(page_number: int, results_per_page: int, total_results: int, seed: int = 0) -> dict:
+    start = (page_number - 1) * results_per_page
+    end = min(start + results_per_page, total_results)
+    return {
+        'search': {
+            'result': {'listings': [generate_listing(index, seed) for index in range(start, end)]},
+            'totalCount': total_results,
+        },
+        'page': {'uriPagination': {'totalListingCounter': total_results, 'page': page_number}},
+    }
@@ -0,0 +1,40 @@
+import dataclasses
+from typing import Iterable, get_args, get_type_hints
+
+from model.listing_model import Listing
+
+## sub-searches the glue-api can return next to the main search, none of them is read by the models
+SUB_SEARCHES = ('expansion', 'nearby', 'superPremium', 'topoFixo')
+
+
+def get_nested_model(annotation) -> type | None:
+    if dataclasses.is_dataclass(annotation):
+        return annotation
+    for argument in get_args(annotation):
+        model = get_nested_model(argument)
+        if model is not None:
+            return model
+    return None
+
+
+## the fields of a model, as the glue-api includeFields syntax expects them. Fields filled after decoding
+## (init=False) are not requested, and nested models deeper than `depth` are requested whole
+def get_model_fields(model: type, depth: int) -> list[str]:
+    type_hints = get_type_hints(model)
+    fields = []
+    for model_field in dataclasses.fields(model):
+        if not model_field.init:
+            continue
+        nested_model = get_nested_model(type_hints[model_field.name])
+        if nested_model is None or depth <= 1:
+            fields.append(model_field.name)
+            continue
+        fields.append(f'{model_field.name}({",".join(get_model_fields(nested_model, depth - 1))})')
+    return fields
+
+
+## includeFields with only what Listing reads, which covers every filter. page is kept for totalListingCounter
+def get_include_fields(sub_searches: Iterable[str] = ()) -> str:
+    listings = ','.join(get_model_fields(Listing, 2))
+    search = f'search(result(listings({listings})),totalCount)'
+    return ','.join([search, 'page', *(f'{name}({search})' for name in sub_searches)])
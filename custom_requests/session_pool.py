@@ -0,0 +1,32 @@
+import logging
+import queue
+from contextlib import contextmanager
+from typing import Iterator
+
+import curl_cffi
+
+logger = logging.getLogger(__name__)
+
+
+class SessionPool:
+    def __init__(self, size: int, cookies: dict | None = None):
+        self.size = max(size, 1)
+        self.sessions = queue.Queue(maxsize=self.size)
+        for _ in range(self.size):
+            session = curl_cffi.Session()
+            if cookies:
+                session.cookies.update(cookies)
+            self.sessions.put(session)
+        logger.info(f'Session pool created with {self.size} sessions')
+
+    @contextmanager
+    def session(self) -> Iterator[curl_cffi.Session]:
+        session = self.sessions.get()
+        try:
+            yield session
+        finally:
+            self.sessions.put(session)
+
+    def close(self):
+        while not self.sessions.empty():
+            self.sessions.get_nowait().close()
@@ -0,0 +1,100 @@
+import logging
+from typing import Callable, NamedTuple
+
+from misc.url_parser import URLParser
+
+logger = logging.getLogger(__name__)
+
+
+class Shard(NamedTuple):
+    url: str
+    total_results: int
+
+
+## Splits one search into disjoint sub-queries until each one is below `max_results`. A shard is split
+## by neighborhood first, then by bedroom count and finally by bisecting its rent price band.
+class ShardPlanner:
+    ## the location params are parallel lists, one entry per selected neighborhood
+    location_params = ('addressCity', 'addressLocationId', 'addressState', 'addressNeighborhood',
+                       'addressPointLat', 'addressPointLon', 'addressType')
+    initial_price_max = 20000
+    max_price = 1000000
+
+    def __init__(self, count_results: Callable[[str], int], max_results: int, min_price_band: int = 50):
+        self.count_results = count_results
+        self.max_results = max_results
+        self.min_price_band = min_price_band
+
+    def plan(self, api_url: str) -> list[Shard]:
+        shards = []
+        pending = [api_url]
+        n_requests = 0
+        while pending:
+            url = pending.pop()
+            total_results = self.count_results(url)
+            n_requests += 1
+            if total_results == 0:
+                continue
+            if total_results <= self.max_results:
+                shards.append(Shard(url, total_results))
+                continue
+            children = self.split(url)
+            if not children:
+                logger.warning(f'Shard with {total_results} results cannot be split any further, results above '
+                               f'{self.max_results} may be missing: {url}')
+                shards.append(Shard(url, total_results))
+                continue
+            pending += reversed(children)
+        logger.info(f'Search split into {len(shards)} shards with {sum(shard.total_results for shard in shards)} '
+                    f'results in total ({n_requests} count requests)')
+        return shards
+
+    def split(self, url: str) -> list[str]:
+        parsed_url = URLParser(url)
+        query = parsed_url.get_query_params()
+        return (self.split_by_neighborhood(parsed_url, query)
+                or self.split_by_bedrooms(parsed_url, query)
+                or self.split_by_price(parsed_url, query))
+
+    @staticmethod
+    def with_params(parsed_url: URLParser, params: dict) -> str:
+        shard_url = URLParser(parsed_url.parsed.geturl())
+        shard_url.replace_query_params(params, add_if_not_exist=True)
+        return shard_url.parsed.geturl()
+
+    def split_by_neighborhood(self, parsed_url: URLParser, query: dict) -> list[str]:
+        neighborhoods = query.get('addressNeighborhood', '').split(',')
+        if len(neighborhoods) < 2:
+            return []
+        values = {name: query[name].split(',') for name in self.location_params if name in query}
+        if any(len(value) != len(neighborhoods) for value in values.values()):
+            logger.warning('Location params do not have one entry per neighborhood, they will not be used for sharding')
+            return []
+        return [self.with_params(parsed_url, {name: value[i] for name, value in values.items()})
+                for i in range(len(neighborhoods))]
+
+    def split_by_bedrooms(self, parsed_url: URLParser, query: dict) -> list[str]:
+        bedrooms = [value for value in query.get('bedrooms', '').split(',') if value]
+        if len(bedrooms) < 2:
+            return []
+        return [self.with_params(parsed_url, {'bedrooms': value}) for value in bedrooms]
+
+    ## bands are inclusive, an unbounded band is split at initial_price_max and then doubled up to max_price
+    def split_by_price(self, parsed_url: URLParser, query: dict) -> list[str]:
+        price_min = int(float(query.get('priceMin') or 0))
+        price_max = int(float(query['priceMax'])) if query.get('priceMax') else None
+        if price_max is None:
+            if price_min >= self.max_price:
+                return []
+            middle = max(self.initial_price_max, price_min * 2)
+        else:
+            if price_max - price_min < 2 * self.min_price_band:
+                return []
+            middle = (price_min + price_max) // 2
+        upper_band = {'priceMin': middle + 1}
+        if price_max is not None:
+            upper_band['priceMax'] = price_max
+        return [
+            self.with_params(parsed_url, {'priceMin': price_min, 'priceMax': middle}),
+            self.with_params(parsed_url, upper_band),
+        ]
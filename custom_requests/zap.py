@@ -1,170 +1,413 @@
+import dataclasses
+import hashlib
+import json
 import logging
-import random
-import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from math import ceil
-from typing import Any
+from typing import Any, Iterable, Iterator, NamedTuple
 
-import curl_cffi
-
-from model.listing_model import Listing
+from custom_requests.field_projection import SUB_SEARCHES, get_include_fields
+from custom_requests.sharding import ShardPlanner
+from custom_requests.zap_session import ZapSession
+from model.listing_model import Listing, search_response_adapter
+from misc.crawl_checkpoint import CrawlCheckpoint
+from misc.deduplication import ListingDeduplicator
+from misc.filter_engine import FilterEngine
+from misc.history_store import HistoryStore
+from misc.listing_store import ListingStore
+from misc.metrics import metrics
 from misc.save_data import SaveData
 from misc.url_parser import URLParser
 
 logger = logging.getLogger(__name__)
 
 
+class DecodedPage(NamedTuple):
+    total_results: int
+    listings: list[Listing]
+    ## raw listing dicts, only decoded when something needs them (JSON file, listing store)
+    listing_json: list[dict] | None
+    ## size of the response body, 0 for pages rebuilt from the listing store
+    n_bytes: int = 0
+
+
 class ZapRequest:
     def __init__(self, config: Any, filters: Any, **kwargs):
         self.base_url = config['base_url']
         self.parsed_api_url = URLParser(config['data_api'])
-        self.session = curl_cffi.Session()
-        self.user_id = None
-        self.save_data = SaveData()
+        self.save_data = kwargs.get('save_data') or SaveData()
         self.save_data_json = True if config['save_json_listings'] == 'True' else False
         self.save_data_csv = True if config['save_csv_listings'] == 'True' else False
+        self.save_data_jsonl = True if config.get('save_jsonl_listings', 'False') == 'True' else False
+        self.save_data_columnar = True if config.get('save_columnar_listings', 'False') == 'True' else False
         self.filters = filters
-        self.get_user_id_from_cookies()
+        self.poi_index = kwargs.get('poi_index')
+        ## a batch run shares one ZapSession (cookies, session pool, rate budget, cache) between its searches
+        self.zap_session = kwargs.get('zap_session') or ZapSession(config)
+        self.max_concurrent_requests = self.zap_session.max_concurrent_requests
+        self.requests_per_second = self.zap_session.requests_per_second
+        ## listings already parsed by another search of the batch, by id
+        self.listing_cache = kwargs.get('listing_cache')
+        self.listing_store = None
+        if config.get('incremental', 'False') == 'True':
+            self.listing_store = ListingStore(config.get('listing_store', 'data/listings.db'))
+            self.full_crawl_seconds = float(config.get('incremental_full_crawl_days', '7')) * 86400
+            self.parsed_api_url.replace_query_params(
+                {'sort': config.get('incremental_sort', 'updatedAt DESC')}, add_if_not_exist=True
+            )
+        self.history_store = None
+        if config.get('history', 'False') == 'True':
+            self.history_store = HistoryStore(config.get('history_store', 'data/history.db'))
+        self.search_name = kwargs.get('search_name', '')
+        self.deduplicator = None
+        if config.get('deduplicate', 'False') == 'True':
+            self.deduplicator = ListingDeduplicator(float(config.get('dedup_threshold', '0.5')))
+        ## pages held back until the whole search is known, only used when deduplicating
+        self.pending_pages = []
+        self.history_run_id = None
+        self.previous_history_run_id = None
+        self.sharding = True if config.get('sharding', 'False') == 'True' else False
+        self.shard_max_results = int(config.get('shard_max_results', '2000'))
+        if self.sharding and self.listing_store is not None:
+            logger.warning('Sharding is not used in incremental mode, the search will not be split')
+            self.sharding = False
+        self.fast_decode = True if config.get('fast_decode', 'False') == 'True' else False
+        self.keep_listing_json = self.save_data_json or self.save_data_jsonl or self.listing_store is not None
+        if self.fast_decode and (self.keep_listing_json or self.listing_cache is not None):
+            logger.warning('fast_decode has no effect with save_json_listings, save_jsonl_listings, incremental or a '
+                           'batch of searches, the pages are decoded from their raw listings')
+        normalized_api_url = self.parsed_api_url.get_normalized_url(('user', 'page', 'from', 'size'))
+        self.search_key = hashlib.sha256(normalized_api_url.encode('utf-8')).hexdigest()
+        self.checkpoint = None
+        if config.get('checkpoint', 'False') == 'True':
+            if self.listing_store is not None:
+                ## pages replayed from a checkpoint are already in the listing store and would stop the crawl
+                logger.warning('Checkpoints are not used in incremental mode, an interrupted crawl cannot be resumed')
+            else:
+                self.checkpoint = CrawlCheckpoint(config.get('checkpoint_dir', 'data/checkpoints'), self.search_key,
+                                                  resume=config.get('resume', 'False') == 'True')
+        elif config.get('resume', 'False') == 'True':
+            logger.warning('There is nothing to resume without checkpoint = True, the crawl starts from page 1')
+        ## the includeFields of data_api is replaced by the fields the models and the active filters read. It is
+        ## done after search_key, so that stored searches keep their key
+        self.field_projection = True if config.get('field_projection', 'False') == 'True' else False
+        self.full_include_fields = self.parsed_api_url.get_query_params().get('includeFields')
+        ## costs one more request per search, so it is only done when asked for
+        self.measure_field_projection = self.field_projection and config.get('measure_field_projection', 'False') == 'True'
+        if self.field_projection:
+            sub_searches = [name.strip() for name in config.get('sub_searches', '').split(',') if name.strip()]
+            for name in sub_searches:
+                if name not in SUB_SEARCHES:
+                    logger.error(f'Unknown sub-search "{name}", expected one of {", ".join(SUB_SEARCHES)}')
+                    raise Exception(f'Unknown sub-search "{name}", expected one of {", ".join(SUB_SEARCHES)}')
+            include_fields = get_include_fields(sub_searches)
+            self.parsed_api_url.replace_query_params({'includeFields': include_fields}, add_if_not_exist=True)
 
     def get_all(self) -> list[Listing]:
-        zap_listings = []
+        return list(self.iter_filtered_listings())
+
+    def iter_filtered_listings(self) -> Iterator[Listing]:
+        for page in self.filter_pages(self.iter_pages()):
+            yield from page
+
+    ## yields the parsed listings page by page, writing every page to the JSON and CSV sinks as soon as it arrives
+    def iter_pages(self) -> Iterator[list[Listing]]:
         results_per_page = 100
-        total_results = 1
-        page_number = 1
-
-        while page_number <= ceil(total_results / results_per_page):
-            logger.info(f'Getting {results_per_page} results at page {page_number}')
-            response = self.get(self.get_paginated_url(results_per_page, page_number))
-            listing_json = response['search']['result']['listings']
-            logger.info(f'Found {len(listing_json)} listings at page {page_number}')
-            for listing in listing_json:
-                listing_serialized = Listing(**listing)
-                zap_listings.append(listing_serialized)
+        incremental = self.listing_store is not None
+        allow_early_stop = incremental and not self.listing_store.needs_full_crawl(self.search_key, self.full_crawl_seconds)
+        fetched_ids = set()
+        stopped_early = False
+        saved = False
+        if self.history_store is not None:
+            self.history_run_id = self.history_store.start_run(self.search_key, self.search_name)
+            self.previous_history_run_id = self.history_store.get_previous_run(self.search_key, self.history_run_id)
+
+        try:
+            if self.sharding:
+                responses = self.iter_sharded_responses(results_per_page)
+            else:
+                ## incremental crawls are sequential, so that no page is requested after the stop condition
+                responses = self.iter_responses(results_per_page, sequential=incremental)
+            for page_number, page in responses:
+                if self.sharding:
+                    ## shards can overlap at band edges, listings are merged by id
+                    page = self.drop_fetched_listings(page, fetched_ids)
+                listing_json = page.listing_json
+                logger.info(f'Found {len(page.listings)} listings at page {page_number}')
+                if not self.sharding:
+                    total_results = page.total_results
+                    logger.info(f'There are {total_results} properties in total (page {page_number}/{ceil(total_results / results_per_page)})')
+
+                page_unchanged = False
+                if incremental:
+                    page_unchanged = self.listing_store.is_page_unchanged(self.search_key, listing_json)
+                    self.listing_store.upsert(self.search_key, listing_json)
+                    fetched_ids.update(ListingStore.get_listing_id(listing) for listing in listing_json)
+
+                yield from self.emit_page(page.listings, listing_json)
+                if self.checkpoint is not None:
+                    self.checkpoint.set_last_page(page_number)
+
+                if allow_early_stop and page_unchanged:
+                    logger.info(f'Every listing at page {page_number} is already known and unchanged - stopping pagination')
+                    stopped_early = True
+                    responses.close()
+                    break
+
+            if stopped_early:
+                n_stored_listings = 0
+                stored_listings = []
+                for listing in self.listing_store.iter_listings(self.search_key, exclude_ids=fetched_ids):
+                    stored_listings.append(listing)
+                    if len(stored_listings) == results_per_page:
+                        n_stored_listings += len(stored_listings)
+                        yield from self.emit_page(self.decode_listings(stored_listings), stored_listings)
+                        stored_listings = []
+                if stored_listings:
+                    n_stored_listings += len(stored_listings)
+                    yield from self.emit_page(self.decode_listings(stored_listings), stored_listings)
+                logger.info(f'Rebuilt {n_stored_listings} listings from the listing store')
+            elif incremental:
+                self.listing_store.finish_full_crawl(self.search_key, fetched_ids)
+            if self.deduplicator is not None:
+                yield from self.flush_deduplicated_pages()
+            if self.history_store is not None:
+                self.finish_history_run()
+            self.save_outputs()
+            saved = True
+            if self.checkpoint is not None:
+                self.checkpoint.finish()
+        except Exception:
+            if self.checkpoint is not None:
+                logger.error(f'Crawl interrupted, the pages fetched so far are kept in "{self.checkpoint.directory}". '
+                             f'Run "app.py fetch --resume" or set resume = True to continue it')
+            raise
+        finally:
+            ## also reached when the consumer stops early (GeneratorExit) or on KeyboardInterrupt, partial
+            ## files would be taken for a complete snapshot by render and export
+            if not saved:
+                self.save_data.discard()
+
+    ## the output files are only renamed to their final names once the whole search went through
+    def save_outputs(self):
+        with metrics.timer('save'):
+            if self.save_data_csv:
+                self.save_data.save_csv_listings()
+            if self.save_data_json:
+                self.save_data.save_json_listings()
+            if self.save_data_jsonl:
+                self.save_data.save_jsonl_listings()
+            if self.save_data_columnar:
+                self.save_data.save_columnar_listings()
+
+    @staticmethod
+    def drop_fetched_listings(page: DecodedPage, fetched_ids: set[str]) -> DecodedPage:
+        keep = []
+        for i, listing in enumerate(page.listings):
+            if listing.listing.id not in fetched_ids:
+                fetched_ids.add(listing.listing.id)
+                keep.append(i)
+        listing_json = [page.listing_json[i] for i in keep] if page.listing_json is not None else None
+        return DecodedPage(page.total_results, [page.listings[i] for i in keep], listing_json, page.n_bytes)
+
+    def emit_page(self, listings: list[Listing], listing_json: list[dict] | None) -> Iterator[list[Listing]]:
+        if self.deduplicator is None:
+            yield self.process_page(listings, listing_json)
+        else:
+            self.pending_pages.append((listings, listing_json))
+
+    ## duplicated ads can be on any page, so deduplication waits for the last one and then releases every page
+    ## without the ads collapsed into another listing
+    def flush_deduplicated_pages(self) -> Iterator[list[Listing]]:
+        with metrics.timer('deduplicate'):
+            keep = self.deduplicator.deduplicate([listing for listings, _ in self.pending_pages for listing in listings])
+        offset = 0
+        for listings, listing_json in self.pending_pages:
+            page_keep = keep[offset:offset + len(listings)]
+            offset += len(listings)
+            if listing_json is not None:
+                listing_json = [listing for listing, keep_listing in zip(listing_json, page_keep) if keep_listing]
+            yield self.process_page([listing for listing, keep_listing in zip(listings, page_keep) if keep_listing],
+                                    listing_json)
+        self.pending_pages = []
+
+    def finish_history_run(self):
+        self.history_store.finish_run(self.history_run_id)
+        if self.previous_history_run_id is None:
+            logger.info(f'Run {self.history_run_id} stored in the history, there is no previous run to compare with')
+            return
+        run_diff = self.history_store.diff(self.previous_history_run_id, self.history_run_id)
+        n_price_drops = sum(1 for _, previous_price, price in run_diff.price_changes
+                            if previous_price is not None and price is not None and price < previous_price)
+        logger.info(f'Since run {self.previous_history_run_id}: {len(run_diff.new_ids)} new listings, '
+                    f'{len(run_diff.removed_ids)} removed, {len(run_diff.price_changes)} price changes '
+                    f'({n_price_drops} price drops)')
+
+    def process_page(self, listings: list[Listing], listing_json: list[dict] | None) -> list[Listing]:
+        if self.poi_index is not None:
+            with metrics.timer('poi'):
+                self.poi_index.annotate(listings)
+        if self.history_store is not None:
+            with metrics.timer('history'):
+                self.history_store.annotate(self.previous_history_run_id, listings)
+                self.history_store.add_listings(self.history_run_id, listings)
+        with metrics.timer('save'):
             if self.save_data_json:
                 self.save_data.add_listings_json(listing_json)
-            total_results = response['page']['uriPagination']['totalListingCounter']
-            logger.info(f'There are {total_results} properties in total (page {page_number}/{ceil(total_results / results_per_page)})')
-            page_number += 1
+            if self.save_data_jsonl:
+                self.save_data.add_listings_jsonl(listing_json)
+            if self.save_data_csv:
+                self.save_data.add_listings_csv(listings, self.base_url)
+            if self.save_data_columnar:
+                self.save_data.add_listings_columnar(listings)
+        return listings
+
+    @staticmethod
+    def decode_listings(listing_json: list[dict]) -> list[Listing]:
+        return [Listing(**listing) for listing in listing_json]
+
+    def decode_page(self, content: bytes) -> DecodedPage:
+        with metrics.timer('decode'):
+            page = self.decode_page_content(content)
+        metrics.increment('listings_parsed_total', len(page.listings))
+        return page
+
+    def decode_page_content(self, content: bytes) -> DecodedPage:
+        ## the fast path validates the whole page straight from the response bytes. When the raw dicts
+        ## are needed anyway, decoding twice is slower than building the models from the dicts
+        ## (see benchmarks/bench_decode.py)
+        if self.fast_decode and not self.keep_listing_json and self.listing_cache is None:
+            response = search_response_adapter.validate_json(content)
+            return DecodedPage(response.page.uriPagination.totalListingCounter, response.search.result.listings, None)
+        response = json.loads(content)
+        listing_json = response['search']['result']['listings']
+        total_results = response['page']['uriPagination']['totalListingCounter']
+        if self.listing_cache is None:
+            return DecodedPage(total_results, self.decode_listings(listing_json), listing_json)
+        return DecodedPage(total_results, self.decode_cached_listings(listing_json), listing_json)
+
+    ## listings that matched an earlier search are reused instead of being validated again. Only the parse
+    ## is shared: every search gets its own Listing, so proximity, priceChange and duplicates set by one
+    ## search do not show up in the others
+    def decode_cached_listings(self, listing_json: list[dict]) -> list[Listing]:
+        listings = []
+        for listing in listing_json:
+            listing_id = ListingStore.get_listing_id(listing)
+            if listing_id not in self.listing_cache:
+                self.listing_cache[listing_id] = Listing(**listing)
+            listings.append(dataclasses.replace(self.listing_cache[listing_id]))
+        return listings
+
+    def fetch_page(self, url: str) -> DecodedPage:
+        content = self.checkpoint.get(url) if self.checkpoint is not None else None
+        if content is None:
+            content = self.get_raw(url)
+            if self.checkpoint is not None:
+                self.checkpoint.put(url, content)
+        return self.decode_page(content)._replace(n_bytes=len(content))
 
-            if page_number <= ceil(total_results / results_per_page):
-                sleep_seconds = random.randint(2, 4)
-                logger.info(f'To avoid API blocks, will wait for {sleep_seconds} seconds before getting the next page')
-                time.sleep(sleep_seconds)
+    ## fetches one page again with the includeFields of data_api and compares the sizes of both responses.
+    ## It is only a diagnostic, so a failure does not stop the search
+    def measure_projection(self, url: str, n_bytes: int | None = None):
+        if self.zap_session.offline:
+            return
+        full_url = URLParser(url)
+        if self.full_include_fields is None:
+            full_url.remove_query_params(('includeFields',))
+        else:
+            full_url.replace_query_params({'includeFields': self.full_include_fields})
+        try:
+            if n_bytes is None:
+                n_bytes = len(self.get_raw(url))
+            n_full_bytes = len(self.get_raw(full_url.parsed.geturl()))
+        except Exception as e:
+            logger.warning(f'Could not measure the field projection: {e}')
+            return
+        if n_bytes == 0 or n_full_bytes == 0:
+            return
+        logger.info(f'Field projection - the first page has {n_bytes / 1024:.1f} KiB instead of {n_full_bytes / 1024:.1f} KiB '
+                    f'with the includeFields of data_api ({1 - n_bytes / n_full_bytes:.0%} smaller)')
+
+    def iter_responses(self, results_per_page: int, sequential: bool = False) -> Iterator[tuple[int, DecodedPage]]:
+        ## the first page is fetched alone to discover totalListingCounter, the others are fetched
+        ## concurrently and yielded in page order
+        logger.info(f'Getting {results_per_page} results at page 1')
+        first_page_url = self.get_paginated_url(results_per_page, 1)
+        first_page = self.fetch_page(first_page_url)
+        if self.measure_field_projection:
+            self.measure_projection(first_page_url, first_page.n_bytes)
+        yield 1, first_page
+        total_results = first_page.total_results
+        total_pages = ceil(total_results / results_per_page)
+        if total_pages <= 1:
+            return
+
+        if sequential:
+            for page_number in range(2, total_pages + 1):
+                logger.info(f'Getting {results_per_page} results at page {page_number}')
+                yield page_number, self.fetch_page(self.get_paginated_url(results_per_page, page_number))
+            return
 
-        if self.save_data_csv:
-            self.save_data.add_listings_csv(zap_listings)
-            self.save_data.save_csv_listings(self.base_url)
-        if self.save_data_json:
-            self.save_data.save_json_listings()
+        logger.info(f'Fetching pages 2 to {total_pages} with {self.max_concurrent_requests} workers '
+                    f'at up to {self.requests_per_second} requests per second')
+        urls = (self.get_paginated_url(results_per_page, page_number) for page_number in range(2, total_pages + 1))
+        yield from enumerate(self.fetch_pages(urls), start=2)
 
-        n_listings_before_filter = len(zap_listings)
-        zap_listings = self.apply_filters(zap_listings)
-        n_listings_after_filter = len(zap_listings)
-        logger.info(f'Listing count - Before filtering: {n_listings_before_filter}, After filtering: {n_listings_after_filter}')
+    ## every page of every shard is known after planning, so they all go through the same worker pool
+    def iter_sharded_responses(self, results_per_page: int) -> Iterator[tuple[int, DecodedPage]]:
+        planner = ShardPlanner(lambda url: self.fetch_page(self.get_paginated_url(1, 1, url)).total_results,
+                               self.shard_max_results)
+        shards = planner.plan(self.parsed_api_url.parsed.geturl())
+        urls = [self.get_paginated_url(results_per_page, page_number, shard.url)
+                for shard in shards for page_number in range(1, ceil(shard.total_results / results_per_page) + 1)]
+        if self.measure_field_projection and urls:
+            self.measure_projection(urls[0])
+        logger.info(f'Fetching {len(urls)} pages from {len(shards)} shards with {self.max_concurrent_requests} workers')
+        yield from enumerate(self.fetch_pages(urls), start=1)
 
-        return zap_listings
+    ## fetches the urls with up to max_concurrent_requests workers, yielding the pages in order with at most
+    ## two pages per worker in flight, so pages that arrive early do not pile up in memory
+    def fetch_pages(self, urls: Iterable[str]) -> Iterator[DecodedPage]:
+        urls = iter(urls)
+        max_in_flight = 2 * self.max_concurrent_requests
+        with ThreadPoolExecutor(max_workers=self.max_concurrent_requests) as executor:
+            in_flight = deque()
+            for url in urls:
+                in_flight.append(executor.submit(self.fetch_page, url))
+                if len(in_flight) >= max_in_flight:
+                    break
+            while in_flight:
+                page = in_flight.popleft().result()
+                next_url = next(urls, None)
+                if next_url is not None:
+                    in_flight.append(executor.submit(self.fetch_page, next_url))
+                yield page
 
-    def get_paginated_url(self, results_per_page: int, page_number: int) -> str:
+    def get_paginated_url(self, results_per_page: int, page_number: int, api_url: str | None = None) -> str:
         page_formatting_params = {
             'size': results_per_page,
             'page': page_number,
             'from': (page_number - 1) * results_per_page
         }
-        self.parsed_api_url.replace_query_params(page_formatting_params)
-        return self.parsed_api_url.parsed.geturl()
+        ## work on a copy so that pages can be built concurrently
+        paginated_url = URLParser(api_url or self.parsed_api_url.parsed.geturl())
+        paginated_url.replace_query_params(page_formatting_params)
+        return paginated_url.parsed.geturl()
 
     def get(self, url: str) -> dict:
-        ## x-domain is the only required header for this call
-        headers = {
-            'x-domain': '.zapimoveis.com.br'
-        }
-        response = self.session.get(url, impersonate='firefox', headers=headers)
-        if response.status_code != 200:
-            logger.error(f'Request failed with status code: {response.status_code}')
-            raise Exception(f'Request failed with status code: {response.status_code}')
-        return response.json()
-
-    def get_user_id_from_cookies(self):
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:138.0) Gecko/20100101 Firefox/138.0',
-            'Accept': '*/*',
-            'Accept-Language': 'en-US,en;q=0.5',
-            'Accept-Encoding': 'gzip, deflate, br, zstd',
-            'Referer': 'https://www.zapimoveis.com.br/',
-            'x-domain': '.zapimoveis.com.br',
-            'X-DeviceId': '93f2af3c-7628-4222-a145-2ca174305347',
-            'Origin': 'https://www.zapimoveis.com.br',
-            'Connection': 'keep-alive',
-            'Sec-Fetch-Dest': 'empty',
-            'Sec-Fetch-Mode': 'cors',
-            'Sec-Fetch-Site': 'same-site',
-            'Priority': 'u=0',
-        }
-        response = self.session.get(self.base_url, headers=headers, impersonate='firefox')
-        if response.status_code != 200:
-            logger.error(f'Request failed with status code: {response.status_code}')
-            raise Exception(f'Request failed with status code: {response.status_code}')
-        cookies = self.session.cookies.get_dict()
-        if 'z_user_id' not in cookies:
-            logger.error(f'Could not find z_user_id in cookies')
-            raise Exception(f'Could not find z_user_id in cookies')
-        self.parsed_api_url.replace_query_params({'user': cookies['z_user_id']})
-        logger.info(f'Got z_user_id from cookies: {cookies['z_user_id']}')
+        return json.loads(self.get_raw(url))
 
-    def apply_filters(self, listings: list[Listing]) -> list[Listing]:
-        rent_price_min, rent_price_max, neighborhood, pets_allowed, min_unit_floor = self.get_filter_params()
-
-        logger.info(f'Applying rent price filter - Min: {rent_price_min}, Max: {rent_price_max}')
-        if neighborhood:
-            logger.info(f'Applying neighborhood filter for "{neighborhood}"')
-        else:
-            logger.info(f'Neighborhood not selected - no filters will be applied for neighborhood')
-        logger.info(f'PETS_ALLOWED filter: "{'' if pets_allowed else 'not '}allowed"')
-        logger.info(f'Min floor filter: {min_unit_floor}')
-
-        return list(filter(
-            lambda listing: self.is_rent_price_ok(listing, rent_price_min, rent_price_max)
-                            and self.is_neighborhood_ok(listing, neighborhood)
-                            and self.is_pets_allowed(listing, pets_allowed)
-                            and self.is_floor_ok(listing, min_unit_floor)
-            , listings
-        ))
-
-    @staticmethod
-    def is_floor_ok(listing: Listing, min_unit_floor: int) -> bool:
-        return listing.listing.unitFloor >= min_unit_floor
+    def get_raw(self, url: str) -> bytes:
+        return self.zap_session.get_raw(url)
 
-    @staticmethod
-    def is_pets_allowed(listing: Listing, pets_allowed: bool) -> bool:
-        # if no filter is provided, get all
-        if not pets_allowed:
-            return True
-        return 'PETS_ALLOWED' in listing.listing.amenities
-
-    @staticmethod
-    def is_rent_price_ok(listing: Listing, rent_price_min: float = 0, rent_price_max: int = 9999999) -> bool:
-        rent = listing.listing.get_rental_pricing_info()
-        if rent is None:
-            return False
-        rent_price = rent.price
-        return rent_price_min <= rent_price <= rent_price_max
+    def apply_filters(self, listings: list[Listing]) -> list[Listing]:
+        return [listing for page in self.filter_pages([listings]) for listing in page]
 
-    @staticmethod
-    def is_neighborhood_ok(listing: Listing, neighborhood: str) -> bool:
-        if not neighborhood:
-            return True
-        return listing.listing.address.neighborhood == neighborhood
+    def filter_pages(self, pages: Iterable[list[Listing]]) -> Iterator[list[Listing]]:
+        yield from FilterEngine(self.filters).filter_pages(pages)
 
     def get_filter_params(self) -> tuple:
-        rent_price_min = self.filters['rent_price_min'].strip()
-        rent_price_min = max(float(rent_price_min), 0) if rent_price_min.isdigit() else 0
-        rent_price_max = self.filters['rent_price_max'].strip()
-        rent_price_max = max(float(rent_price_max), 0) if rent_price_max.isdigit() else 9999999
-        if rent_price_max <= rent_price_min:
-            logger.error('rent_price_max must be greater than rent_price_min')
-            raise Exception('rent_price_max must be greater than rent_price_min')
-        neighborhood = self.filters['neighborhood'].strip()
-        pets_allowed = True if self.filters['pets_allowed'].strip() == 'True' else False
-        min_unit_floor_value = self.filters['min_unit_floor'].strip()
-        min_unit_floor = max(int(min_unit_floor_value), 0) if min_unit_floor_value.isdigit() else 0
-
-        return rent_price_min, rent_price_max, neighborhood, pets_allowed, min_unit_floor
\ No newline at end of file
+        filter_engine = FilterEngine(self.filters)
+        return (filter_engine.rent_price_min, filter_engine.rent_price_max, filter_engine.neighborhood,
+                filter_engine.pets_allowed, filter_engine.min_unit_floor)
@@ -0,0 +1,190 @@
+import logging
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any
+
+import curl_cffi
+from curl_cffi.requests.exceptions import RequestException
+
+from custom_requests.session_pool import SessionPool
+from misc.metrics import metrics
+from misc.rate_limiter import TokenBucket
+from misc.response_cache import ResponseCache
+from misc.url_parser import URLParser
+
+logger = logging.getLogger(__name__)
+
+
+## network state shared by every search of a run: one cookie bootstrap, one bounded pool of warmed
+## sessions, one rate budget and one response cache
+class ZapSession:
+    retryable_status_codes = (429, 500, 502, 503, 504)
+    ## the glue-api answers these when the z_user_id cookie is no longer accepted
+    auth_status_codes = (401, 403)
+    ## [ZAP] keys read here, a batch of searches shares one session so they cannot change per search
+    config_keys = ('max_concurrent_requests', 'requests_per_second', 'max_retries', 'retry_backoff_seconds',
+                   'retry_max_backoff_seconds', 'offline', 'cache_responses', 'cache_dir', 'cache_ttl_hours',
+                   'cache_max_size_mb')
+
+    def __init__(self, config: Any):
+        self.base_url = config['base_url']
+        self.session = curl_cffi.Session()
+        self.user_id = None
+        self.max_concurrent_requests = max(int(config.get('max_concurrent_requests', '1')), 1)
+        self.requests_per_second = float(config.get('requests_per_second', '0.33'))
+        self.rate_limiter = TokenBucket(self.requests_per_second, self.max_concurrent_requests)
+        self.session_pool = None
+        self.session_lock = threading.Lock()
+        ## pools replaced by a cookie refresh, closed with the session since workers may still hold their sessions
+        self.retired_session_pools = []
+        ## incremented on every cookie refresh, so that workers failing together refresh it only once
+        self.session_generation = 0
+        self.max_retries = max(int(config.get('max_retries', '5')), 0)
+        self.retry_backoff_seconds = float(config.get('retry_backoff_seconds', '2'))
+        self.retry_max_backoff_seconds = float(config.get('retry_max_backoff_seconds', '120'))
+        self.offline = True if config.get('offline', 'False') == 'True' else False
+        self.response_cache = None
+        if self.offline or config.get('cache_responses', 'False') == 'True':
+            ## an offline run replays whatever is cached, expired responses are neither refused nor deleted
+            self.response_cache = ResponseCache(
+                config.get('cache_dir', 'cache'),
+                ttl_seconds=0 if self.offline else float(config.get('cache_ttl_hours', '0')) * 3600,
+                max_size_bytes=int(float(config.get('cache_max_size_mb', '0')) * 1024 * 1024),
+            )
+
+    def get_raw(self, url: str) -> bytes:
+        if self.response_cache is not None:
+            content = self.response_cache.get(url)
+            if content is not None:
+                logger.debug(f'Serving {url} from the response cache')
+                metrics.increment('cache_hits_total')
+                return content
+        if self.offline:
+            logger.error(f'Offline mode is enabled and there is no cached response for {url}')
+            raise Exception(f'Offline mode is enabled and there is no cached response for {url}')
+
+        ## the cookie bootstrap only happens when something actually has to be fetched
+        self.ensure_session()
+        ## x-domain is the only required header for this call
+        headers = {
+            'x-domain': '.zapimoveis.com.br'
+        }
+        ## network errors, 429 and 5xx are retried with exponential backoff, auth failures after a cookie refresh
+        for attempt in range(self.max_retries + 1):
+            generation = self.session_generation
+            request_url = self.replace_user_id(url)
+            retry_after = None
+            self.rate_limiter.acquire()
+            try:
+                with self.session_pool.session() as session:
+                    start = time.perf_counter()
+                    response = session.get(request_url, impersonate='firefox', headers=headers)
+                    metrics.observe('request_seconds', time.perf_counter() - start)
+            except RequestException as e:
+                metrics.increment('request_errors_total', labels={'status': 'network'})
+                error_message = f'Request failed: {e}'
+            else:
+                metrics.increment('requests_total')
+                metrics.increment('response_bytes_total', len(response.content))
+                if response.status_code == 200:
+                    if self.response_cache is not None:
+                        self.response_cache.put(request_url, response.content)
+                    return response.content
+                metrics.increment('request_errors_total', labels={'status': response.status_code})
+                error_message = f'Request failed with status code: {response.status_code}'
+                if response.status_code in self.auth_status_codes:
+                    self.refresh_session(generation)
+                elif response.status_code not in self.retryable_status_codes:
+                    logger.error(error_message)
+                    raise Exception(error_message)
+                retry_after = self.get_retry_after(response.headers.get('Retry-After'))
+            if attempt == self.max_retries:
+                break
+            delay = self.get_backoff(attempt, retry_after)
+            metrics.increment('request_retries_total')
+            logger.warning(f'{error_message} - retrying in {delay:.1f} s (retry {attempt + 1} of {self.max_retries})')
+            time.sleep(delay)
+        logger.error(f'{error_message} - giving up after {self.max_retries} retries')
+        raise Exception(f'{error_message} - giving up after {self.max_retries} retries')
+
+    ## exponential backoff with full jitter, never shorter than the Retry-After asked by the server
+    def get_backoff(self, attempt: int, retry_after: float | None = None) -> float:
+        delay = random.uniform(0, min(self.retry_max_backoff_seconds, self.retry_backoff_seconds * 2 ** attempt))
+        return max(delay, retry_after or 0)
+
+    ## Retry-After is either a number of seconds or an HTTP date
+    @staticmethod
+    def get_retry_after(value: str | None) -> float | None:
+        if not value:
+            return None
+        value = value.strip()
+        if value.isdigit():
+            return float(value)
+        try:
+            return max((parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds(), 0)
+        except (TypeError, ValueError):
+            logger.warning(f'Ignoring invalid Retry-After header: {value}')
+            return None
+
+    ## bootstraps a new z_user_id cookie, unless another worker already did it since `generation`
+    def refresh_session(self, generation: int):
+        with self.session_lock:
+            if generation != self.session_generation:
+                return
+            logger.warning(f'The z_user_id {self.user_id} was refused, getting a new one')
+            metrics.increment('session_refreshes_total')
+            self.retired_session_pools.append(self.session_pool)
+            self.session.close()
+            self.session = curl_cffi.Session()
+            self.get_user_id_from_cookies()
+            self.session_generation += 1
+
+    def ensure_session(self):
+        with self.session_lock:
+            if self.session_pool is None:
+                self.get_user_id_from_cookies()
+
+    def replace_user_id(self, url: str) -> str:
+        if self.user_id is None:
+            return url
+        parsed_url = URLParser(url)
+        parsed_url.replace_query_params({'user': self.user_id})
+        return parsed_url.parsed.geturl()
+
+    def get_user_id_from_cookies(self):
+        headers = {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:138.0) Gecko/20100101 Firefox/138.0',
+            'Accept': '*/*',
+            'Accept-Language': 'en-US,en;q=0.5',
+            'Accept-Encoding': 'gzip, deflate, br, zstd',
+            'Referer': 'https://www.zapimoveis.com.br/',
+            'x-domain': '.zapimoveis.com.br',
+            'X-DeviceId': '93f2af3c-7628-4222-a145-2ca174305347',
+            'Origin': 'https://www.zapimoveis.com.br',
+            'Connection': 'keep-alive',
+            'Sec-Fetch-Dest': 'empty',
+            'Sec-Fetch-Mode': 'cors',
+            'Sec-Fetch-Site': 'same-site',
+            'Priority': 'u=0',
+        }
+        self.rate_limiter.acquire()
+        response = self.session.get(self.base_url, headers=headers, impersonate='firefox')
+        if response.status_code != 200:
+            logger.error(f'Request failed with status code: {response.status_code}')
+            raise Exception(f'Request failed with status code: {response.status_code}')
+        cookies = self.session.cookies.get_dict()
+        if 'z_user_id' not in cookies:
+            logger.error(f'Could not find z_user_id in cookies')
+            raise Exception(f'Could not find z_user_id in cookies')
+        self.user_id = cookies['z_user_id']
+        self.session_pool = SessionPool(self.max_concurrent_requests, cookies)
+        logger.info(f'Got z_user_id from cookies: {self.user_id}')
+
+    def close(self):
+        for session_pool in [*self.retired_session_pools, self.session_pool]:
+            if session_pool is not None:
+                session_pool.close()
+        self.session.close()
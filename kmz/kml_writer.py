@@ -0,0 +1,108 @@
+import io
+import logging
+import os
+import zipfile
+from xml.sax.saxutils import escape, quoteattr
+
+from misc.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class KmlWriter:
+    def __init__(self, destination: str, name: str = 'RentMap', open_document: bool = True):
+        self.destination = destination
+        self.name = name
+        self.open_document = open_document
+        self.styles = {}
+        self.local_files = {}
+        self.zip_file = None
+        self.kml_file = None
+        self.n_placemarks = 0
+
+    ## styles are shared by every placemark that uses the same icon, color and scales, and must all be
+    ## registered before the first placemark because KML requires them to come before the features
+    def get_style_id(self, icon: str | None = None, icon_color: str | None = None, icon_scale: float = 1.0,
+                     label_scale: float = 0.8) -> str:
+        key = (icon, icon_color, icon_scale, label_scale)
+        if key not in self.styles:
+            if self.kml_file is not None:
+                raise ValueError(f'Style {key} must be registered before the first placemark is written')
+            self.styles[key] = f's{len(self.styles)}'
+        return self.styles[key]
+
+    def get_icon_href(self, icon: str, prefix: str = '') -> str:
+        ## local icons are packed into the KMZ, like simplekml does
+        if os.path.isfile(icon):
+            return prefix + self.local_files.setdefault(icon, f'files/{os.path.basename(icon)}')
+        return icon
+
+    def get_document_header(self, name: str) -> str:
+        return ('<?xml version="1.0" encoding="UTF-8"?>\n'
+                '<kml xmlns="http://www.opengis.net/kml/2.2"><Document>'
+                f'<name>{escape(name)}</name><open>{int(self.open_document)}</open>\n')
+
+    ## prefix makes the packed icons reachable from KML files in subfolders of the KMZ
+    def get_styles_xml(self, prefix: str = '') -> str:
+        styles = []
+        for (icon, icon_color, icon_scale, label_scale), style_id in self.styles.items():
+            icon_style = f'<scale>{icon_scale}</scale>'
+            if icon_color is not None:
+                icon_style = f'<color>{icon_color}</color>' + icon_style
+            if icon is not None:
+                icon_style += f'<Icon><href>{escape(self.get_icon_href(icon, prefix))}</href></Icon>'
+            styles.append(f'<Style id={quoteattr(style_id)}><IconStyle>{icon_style}</IconStyle>'
+                          f'<LabelStyle><scale>{label_scale}</scale></LabelStyle></Style>\n')
+        return ''.join(styles)
+
+    @staticmethod
+    def get_placemark_xml(lat: float, lon: float, name: str | None, description: str | None, style_id: str) -> str:
+        placemark = f'<Placemark><name>{escape(name or "")}</name>'
+        if description:
+            placemark += f'<description><![CDATA[{description.replace("]]>", "]]]]><![CDATA[>")}]]></description>'
+        return placemark + f'<styleUrl>#{style_id}</styleUrl><Point><coordinates>{lon},{lat},0</coordinates></Point></Placemark>\n'
+
+    def open_entry(self, entry_name: str):
+        if self.zip_file is None:
+            self.zip_file = zipfile.ZipFile(f'{self.destination}.tmp', 'w', compression=zipfile.ZIP_DEFLATED)
+        return io.TextIOWrapper(self.zip_file.open(entry_name, 'w'), encoding='utf-8')
+
+    def begin(self):
+        self.kml_file = self.open_entry('doc.kml')
+        self.kml_file.write(self.get_document_header(self.name) + self.get_styles_xml())
+
+    ## rent is only used by writers that aggregate placemarks (see LodKmlWriter)
+    def add_placemark(self, lat: float, lon: float, name: str | None, description: str | None, style_id: str,
+                      rent: float | None = None):
+        if self.kml_file is None:
+            self.begin()
+        self.kml_file.write(self.get_placemark_xml(lat, lon, name, description, style_id))
+        self.n_placemarks += 1
+
+    def close(self):
+        if self.kml_file is None:
+            self.begin()
+        self.kml_file.write('</Document></kml>\n')
+        self.kml_file.close()
+        self.finish()
+
+    ## removes the partial archive of a run that failed, the KMZ of the previous run is left untouched
+    def discard(self):
+        try:
+            if self.kml_file is not None and not self.kml_file.closed:
+                self.kml_file.close()
+            if self.zip_file is not None:
+                self.zip_file.close()
+        except (OSError, ValueError):
+            pass
+        if os.path.exists(f'{self.destination}.tmp'):
+            os.remove(f'{self.destination}.tmp')
+            logger.warning(f'The KMZ was not finished, {self.destination}.tmp removed')
+
+    def finish(self):
+        for path, archive_name in self.local_files.items():
+            self.zip_file.write(path, archive_name)
+        self.zip_file.close()
+        os.replace(f'{self.destination}.tmp', self.destination)
+        metrics.increment('placemarks_written_total', self.n_placemarks)
+        logger.info(f'{self.n_placemarks} placemarks and {len(self.styles)} shared styles written to {self.destination}')
@@ -1,10 +1,12 @@
 import json
 import logging
-from typing import Any, List
+from typing import Any, Iterable, List
 
-import simplekml
 from pydantic import TypeAdapter
 
+from kmz.kml_writer import KmlWriter
+from kmz.lod_writer import LodKmlWriter
+from misc.metrics import metrics
 from model.MarketModel import MarketModel
 from model.listing_model import Listing
 
@@ -12,40 +14,82 @@ logger = logging.getLogger(__name__)
 
 
 class KMZ:
-    def __init__(self, listings: list[Listing], config: Any, utilities: Any, destination: str = 'rentMap.kmz'):
+    def __init__(self, listings: Iterable[Listing], config: Any, utilities: Any, destination: str = 'rentMap.kmz'):
         self.listings = listings
         self.destination = destination
-        self.kml = simplekml.Kml(open=1, name='RentMap')
         self.base_url = config['base_url']
         self.utilities = utilities
+        self.kml = self.get_kml_writer(utilities, destination)
+        add_markets = True if self.utilities['add_markets'] == 'True' else False
+        self.markets = self.get_markets_from_json() if add_markets else []
+        ## placemarks are streamed into the KMZ, so every style has to be known before the first one
+        for icon, icon_color in Listing.get_kml_icons():
+            self.kml.get_style_id(icon, icon_color)
+        for market in self.markets:
+            self.kml.get_style_id(market.icon, market.icon_color, market.icon_scale, market.label_scale)
+
+    @staticmethod
+    def get_kml_writer(utilities: Any, destination: str) -> KmlWriter:
+        if utilities.get('lod_tiles', 'False') == 'True':
+            max_placemarks_per_tile = int(utilities.get('lod_max_placemarks_per_tile', '250'))
+            return LodKmlWriter(destination, name='RentMap', max_placemarks_per_tile=max_placemarks_per_tile)
+        return KmlWriter(destination, name='RentMap')
 
+    ## listings can be any iterable (e.g. ZapRequest.iter_filtered_listings), they are consumed as they arrive
     def process_listings(self):
-        for listing in self.listings:
-            address_point = listing.get_address_point()
-            if address_point is None:
-                error_message = f"Address Point {address_point} not found. Program will continue"
-                logger.warning(error_message)
-                continue
-            lat, lon = address_point.get_lat_lon()
-
-            general_description = listing.listing.description
-            pricing_description = listing.listing.get_rental_pricing_info()
-            if pricing_description is None:
-                logger.info(f"Listing with href {listing.link.href} does not have rent price")
-                continue
-            pricing_description = pricing_description.get_pricing_description()
-            contact_info = listing.get_contact_info()
-            description = pricing_description + '<br><br>' + contact_info + '<br><br>' + general_description
-            if listing.listing.address.point.is_address_approximated():
-                description = self.get_approximated_address_warn(listing.listing.address.get_address()) + '<br><br>' + description
-            href = listing.link.href
-
-            self.populate_kml(lat, lon, description, href, icon=listing.kml_icon, icon_color=listing.kml_icon_color)
-        self.add_utilities()
-        self.generate_kmz()
+        try:
+            for listing in self.listings:
+                with metrics.timer('kmz'):
+                    self.add_listing(listing)
+            with metrics.timer('kmz'):
+                self.add_utilities()
+                self.generate_kmz()
+        except BaseException:
+            self.kml.discard()
+            ## closing the listing generator now lets ZapRequest discard its partial files
+            if hasattr(self.listings, 'close'):
+                self.listings.close()
+            raise
 
-    def populate_kml(self, lat: float, lon: float, description: str | None, href: str | None, title: str | None = '',
-                     icon: str = None, icon_color: str = None, icon_scale: float = 1.0, label_scale: float = 0.8):
+    def add_listing(self, listing: Listing):
+        placemark = self.get_listing_placemark(listing)
+        if placemark is None:
+            return
+        lat, lon, description, icon, icon_color = placemark
+        style_id = self.kml.get_style_id(icon, icon_color)
+        self.kml.add_placemark(lat, lon, '', description, style_id, listing.listing.get_rental_pricing_info().price)
+
+    ## position, full description and icon of the placemark of a listing, None when it cannot be placed on the map
+    def get_listing_placemark(self, listing: Listing) -> tuple[float, float, str, str, str] | None:
+        address_point = listing.get_address_point()
+        if address_point is None:
+            error_message = f"Address Point {address_point} not found. Program will continue"
+            logger.warning(error_message)
+            return None
+        lat, lon = address_point.get_lat_lon()
+
+        general_description = listing.listing.description
+        pricing_description = listing.listing.get_rental_pricing_info()
+        if pricing_description is None:
+            logger.info(f"Listing with href {listing.link.href} does not have rent price")
+            return None
+        pricing_description = pricing_description.get_pricing_description()
+        contact_info = listing.get_contact_info()
+        description = pricing_description + '<br><br>' + contact_info + '<br><br>' + general_description
+        if listing.proximity is not None:
+            description = listing.proximity.get_proximity_description() + '<br><br>' + description
+        if listing.duplicates is not None:
+            description = description + '<br><br>' + listing.duplicates.get_duplicates_description(self.base_url)
+        if listing.priceChange is not None:
+            description = listing.priceChange.get_change_description() + '<br><br>' + description
+        if listing.listing.address.point.is_address_approximated():
+            description = self.get_approximated_address_warn(listing.listing.address.get_address()) + '<br><br>' + description
+        href = listing.link.href
+
+        icon, icon_color = listing.get_kml_icon()
+        return lat, lon, self.get_full_description(description, href), icon, icon_color
+
+    def get_full_description(self, description: str | None, href: str | None) -> str:
         if href is None:
             url = ""
         else:
@@ -53,17 +97,16 @@ class KMZ:
         full_description = url
         if description is not None:
             full_description += '<br><br>' + description
-        point = self.kml.newpoint(name = title, coords = [(lon, lat)], description = full_description)
-        if icon is not None:
-            point.iconstyle.icon.href = icon
-            if icon_color is not None:
-                point.iconstyle.color = icon_color
-        point.iconstyle.scale = icon_scale
-        point.style.labelstyle.scale = label_scale
+        return full_description
 
+    def populate_kml(self, lat: float, lon: float, description: str | None, href: str | None, title: str | None = '',
+                     icon: str = None, icon_color: str = None, icon_scale: float = 1.0, label_scale: float = 0.8,
+                     rent: float | None = None):
+        style_id = self.kml.get_style_id(icon, icon_color if icon is not None else None, icon_scale, label_scale)
+        self.kml.add_placemark(lat, lon, title, self.get_full_description(description, href), style_id, rent)
 
     def generate_kmz(self):
-        self.kml.savekmz(self.destination)
+        self.kml.close()
         logger.info(f'KMZ file {self.destination} generated')
 
     @staticmethod
@@ -78,9 +121,7 @@ class KMZ:
         return type_adapter.validate_python(market_data)
 
     def add_utilities(self):
-        add_markets = True if self.utilities['add_markets'] == 'True' else False
-        if add_markets:
-            for market in self.get_markets_from_json():
-                logger.info(f'Checking Market name special chars: {market.name}')
-                self.populate_kml(market.lat, market.lon, None, None, market.name, market.icon,
-                                  market.icon_color, market.icon_scale, market.label_scale)
+        for market in self.markets:
+            logger.info(f'Checking Market name special chars: {market.name}')
+            self.populate_kml(market.lat, market.lon, None, None, market.name, market.icon,
+                              market.icon_color, market.icon_scale, market.label_scale)
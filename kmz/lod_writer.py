@@ -0,0 +1,131 @@
+import logging
+from collections import deque
+from statistics import median
+from typing import NamedTuple
+
+from kmz.kml_writer import KmlWriter
+
+logger = logging.getLogger(__name__)
+
+
+class BufferedPlacemark(NamedTuple):
+    lat: float
+    lon: float
+    placemark_xml: str
+    rent: float
+
+
+class Tile(NamedTuple):
+    key: str
+    placemarks: list[BufferedPlacemark]
+    north: float
+    south: float
+    east: float
+    west: float
+
+
+## Writes the listings as a quadtree of KML tiles. Coarse tiles show one cluster placemark per child tile
+## with the listing count and median rent, and each child tile is loaded lazily through a NetworkLink with
+## a <Region>, so Google Earth only loads the detail of what is on screen.
+class LodKmlWriter(KmlWriter):
+    cluster_icon = 'http://maps.google.com/mapfiles/kml/shapes/placemark_circle.png'
+    max_depth = 12
+
+    def __init__(self, destination: str, name: str = 'RentMap', max_placemarks_per_tile: int = 250,
+                 lod_pixels: int = 256, open_document: bool = True):
+        super().__init__(destination, name, open_document)
+        self.max_placemarks_per_tile = max(max_placemarks_per_tile, 4)
+        self.lod_pixels = lod_pixels
+        self.cluster_style_id = self.get_style_id(self.cluster_icon, None, 1.4, 1.0)
+        ## placemarks without rent (e.g. markets) are always visible in the root document
+        self.root_placemarks = []
+        self.tiled_placemarks = []
+        self.n_tiles = 0
+
+    def add_placemark(self, lat: float, lon: float, name: str | None, description: str | None, style_id: str,
+                      rent: float | None = None):
+        placemark_xml = self.get_placemark_xml(lat, lon, name, description, style_id)
+        if rent is None:
+            self.root_placemarks.append(placemark_xml)
+        else:
+            self.tiled_placemarks.append(BufferedPlacemark(lat, lon, placemark_xml, rent))
+        self.n_placemarks += 1
+
+    def close(self):
+        placemarks = self.tiled_placemarks
+        ## the padding keeps regions from being empty when every listing shares the same coordinates
+        padding = 0.001
+        if placemarks:
+            root = Tile('', placemarks, max(p.lat for p in placemarks) + padding, min(p.lat for p in placemarks) - padding,
+                        max(p.lon for p in placemarks) + padding, min(p.lon for p in placemarks) - padding)
+        else:
+            root = Tile('', [], 0, 0, 0, 0)
+
+        ## breadth-first, each tile is written as its own entry before its children
+        tiles = deque([root])
+        while tiles:
+            tile = tiles.popleft()
+            children = self.split(tile)
+            self.write_tile(tile, children)
+            tiles.extend(children)
+        self.finish()
+        logger.info(f'{len(placemarks)} placemarks split into {self.n_tiles} level-of-detail tiles')
+
+    def split(self, tile: Tile) -> list[Tile]:
+        if len(tile.placemarks) <= self.max_placemarks_per_tile or len(tile.key) >= self.max_depth:
+            return []
+        middle_lat = (tile.north + tile.south) / 2
+        middle_lon = (tile.east + tile.west) / 2
+        quadrants = {'0': [], '1': [], '2': [], '3': []}
+        for placemark in tile.placemarks:
+            quadrant = (2 if placemark.lat < middle_lat else 0) + (1 if placemark.lon >= middle_lon else 0)
+            quadrants[str(quadrant)].append(placemark)
+        bounds = {
+            '0': (tile.north, middle_lat, middle_lon, tile.west),
+            '1': (tile.north, middle_lat, tile.east, middle_lon),
+            '2': (middle_lat, tile.south, middle_lon, tile.west),
+            '3': (middle_lat, tile.south, tile.east, middle_lon),
+        }
+        return [Tile(tile.key + quadrant, quadrant_placemarks, *bounds[quadrant])
+                for quadrant, quadrant_placemarks in quadrants.items() if quadrant_placemarks]
+
+    @staticmethod
+    def get_entry_name(tile: Tile) -> str:
+        return 'doc.kml' if not tile.key else f'tiles/{tile.key}.kml'
+
+    @staticmethod
+    def get_region_xml(tile: Tile, min_lod_pixels: int, max_lod_pixels: int = -1) -> str:
+        return (f'<Region><LatLonAltBox><north>{tile.north}</north><south>{tile.south}</south>'
+                f'<east>{tile.east}</east><west>{tile.west}</west></LatLonAltBox>'
+                f'<Lod><minLodPixels>{min_lod_pixels}</minLodPixels><maxLodPixels>{max_lod_pixels}</maxLodPixels></Lod></Region>')
+
+    def get_cluster_xml(self, tile: Tile) -> str:
+        lat = sum(placemark.lat for placemark in tile.placemarks) / len(tile.placemarks)
+        lon = sum(placemark.lon for placemark in tile.placemarks) / len(tile.placemarks)
+        median_rent = median(placemark.rent for placemark in tile.placemarks)
+        description = f'{len(tile.placemarks)} imóveis<br>Aluguel mediano: R${median_rent:.2f}'
+        placemark = self.get_placemark_xml(lat, lon, str(len(tile.placemarks)), description, self.cluster_style_id)
+        ## the cluster disappears when its tile is close enough to be loaded
+        return f'<Folder>{self.get_region_xml(tile, 0, self.lod_pixels)}{placemark}</Folder>\n'
+
+    def get_network_link_xml(self, tile: Tile, prefix: str) -> str:
+        return (f'<NetworkLink><name>{tile.key}</name>{self.get_region_xml(tile, self.lod_pixels)}'
+                f'<Link><href>{prefix}{self.get_entry_name(tile)}</href><viewRefreshMode>onRegion</viewRefreshMode></Link>'
+                '</NetworkLink>\n')
+
+    def write_tile(self, tile: Tile, children: list[Tile]):
+        prefix = '../' if tile.key else ''
+        kml_file = self.open_entry(self.get_entry_name(tile))
+        kml_file.write(self.get_document_header(self.name if not tile.key else tile.key))
+        kml_file.write(self.get_styles_xml(prefix))
+        if not tile.key:
+            kml_file.writelines(self.root_placemarks)
+        if children:
+            for child in children:
+                kml_file.write(self.get_cluster_xml(child))
+                kml_file.write(self.get_network_link_xml(child, prefix))
+        else:
+            kml_file.writelines(placemark.placemark_xml for placemark in tile.placemarks)
+        kml_file.write('</Document></kml>\n')
+        kml_file.close()
+        self.n_tiles += 1
@@ -0,0 +1,129 @@
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Iterable, NamedTuple
+
+import numpy as np
+
+from kmz.kmz import KMZ
+from misc.filter_engine import FilterEngine
+from misc.metrics import metrics
+from model.listing_model import Listing
+from model.listing_table import ListingTable
+
+logger = logging.getLogger(__name__)
+
+
+class Placemark(NamedTuple):
+    lat: float
+    lon: float
+    name: str
+    description: str
+    ## icon, icon color, icon scale and label scale, as given to KmlWriter.get_style_id
+    style: tuple
+    rent: float | None
+
+
+## placemarks, CSV lines and styles of the crawl, set once per worker process by the pool initializer
+## (inherited when the pool forks) instead of being sent with every profile
+worker_state = {}
+
+
+def init_worker(placemarks: list[Placemark | None], csv_lines: list[str | None], market_placemarks: list[Placemark],
+                styles: list[tuple], utilities: dict):
+    worker_state.update(placemarks=placemarks, csv_lines=csv_lines, market_placemarks=market_placemarks, styles=styles,
+                        utilities=utilities)
+
+
+## writes the KMZ and the CSV of one profile from the listings at `indices`, runs in a worker process
+def write_profile(name: str, indices: list[int], kmz_destination: str, csv_destination: str) -> tuple[str, int, int]:
+    kml = KMZ.get_kml_writer(worker_state['utilities'], kmz_destination)
+    try:
+        for style in worker_state['styles']:
+            kml.get_style_id(*style)
+        placemarks = worker_state['placemarks']
+        for placemark in [placemarks[i] for i in indices if placemarks[i] is not None] + worker_state['market_placemarks']:
+            kml.add_placemark(placemark.lat, placemark.lon, placemark.name, placemark.description,
+                              kml.get_style_id(*placemark.style), placemark.rent)
+        kml.close()
+    except BaseException:
+        kml.discard()
+        raise
+
+    n_csv_lines = 0
+    try:
+        with open(f'{csv_destination}.tmp', 'w', encoding='utf-8') as file:
+            file.write(Listing.get_csv_headers() + '\n')
+            for i in indices:
+                line = worker_state['csv_lines'][i]
+                if line is not None:
+                    file.write(line + '\n')
+                    n_csv_lines += 1
+    except BaseException:
+        os.remove(f'{csv_destination}.tmp')
+        raise
+    os.replace(f'{csv_destination}.tmp', csv_destination)
+    return name, kml.n_placemarks, n_csv_lines
+
+
+## Evaluates several named filter profiles against the listings of one crawl. The description HTML and the
+## CSV line of each listing are built once, the filters of every profile run over one ListingTable, and the
+## KMZ and CSV of each profile are written in a process pool
+class ProfileRenderer:
+    def __init__(self, config: Any, utilities: Any, profiles: list[tuple[str, Any]], prefix: str = 'rentMap',
+                 workers: int = 0):
+        self.renderer = KMZ([], config, utilities)
+        self.base_url = config['base_url']
+        self.utilities = dict(utilities)
+        self.profiles = profiles
+        self.prefix = prefix
+        self.workers = workers if workers > 0 else (os.cpu_count() or 1)
+        self.placemarks: list[Placemark | None] = []
+        self.csv_lines: list[str | None] = []
+        self.tables: list[ListingTable] = []
+
+    def add_page(self, listings: list[Listing]):
+        with metrics.timer('kmz'):
+            for listing in listings:
+                placemark = self.renderer.get_listing_placemark(listing)
+                if placemark is None:
+                    self.placemarks.append(None)
+                    continue
+                lat, lon, description, icon, icon_color = placemark
+                self.placemarks.append(Placemark(lat, lon, '', description, (icon, icon_color, 1.0, 0.8),
+                                                 listing.listing.get_rental_pricing_info().price))
+        with metrics.timer('save'):
+            self.csv_lines += [listing.get_csv_line(self.base_url) for listing in listings]
+        with metrics.timer('filter'):
+            self.tables.append(ListingTable.from_listings(listings))
+
+    def get_market_placemarks(self) -> list[Placemark]:
+        return [Placemark(market.lat, market.lon, market.name, self.renderer.get_full_description(None, None),
+                          (market.icon, market.icon_color, market.icon_scale, market.label_scale), None)
+                for market in self.renderer.markets]
+
+    ## pages can be any iterable of listing pages (e.g. ZapRequest.iter_pages), only their placemarks, CSV
+    ## lines and filter columns are kept
+    def render(self, pages: Iterable[list[Listing]]):
+        for page in pages:
+            self.add_page(page)
+        with metrics.timer('filter'):
+            table = ListingTable.concat(self.tables)
+        tasks = []
+        for name, filters in self.profiles:
+            filter_engine = FilterEngine(filters)
+            with metrics.timer('filter'):
+                mask = filter_engine.get_mask(table)
+            logger.info(f'Profile "{name}" - Before filtering: {len(table)}, After filtering: {int(mask.sum())}')
+            tasks.append((name, np.flatnonzero(mask).tolist(), f'{self.prefix}_{name}.kmz', f'{self.prefix}_{name}.csv'))
+
+        with metrics.timer('profiles'):
+            with ProcessPoolExecutor(max_workers=min(self.workers, len(tasks)), initializer=init_worker,
+                                     initargs=(self.placemarks, self.csv_lines, self.get_market_placemarks(),
+                                               list(self.renderer.kml.styles), self.utilities)) as executor:
+                results = list(executor.map(write_profile, *zip(*tasks)))
+        for (name, n_placemarks, n_csv_lines), (_, _, kmz_destination, csv_destination) in zip(results, tasks):
+            ## the workers have their own metrics, their placemarks are counted here
+            metrics.increment('placemarks_written_total', n_placemarks)
+            logger.info(f'Profile "{name}" - {n_placemarks} placemarks written to {kmz_destination}, '
+                        f'{n_csv_lines} listings to {csv_destination}')
@@ -0,0 +1,175 @@
+import hashlib
+import logging
+import threading
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterable, NamedTuple
+from xml.sax.saxutils import escape
+
+from kmz.kml_writer import KmlWriter
+from kmz.kmz import KMZ
+from misc.metrics import metrics
+from model.listing_model import Listing
+
+logger = logging.getLogger(__name__)
+
+
+class KmlDocument(NamedTuple):
+    content: bytes
+    etag: str
+
+
+class RenderedPlacemark(NamedTuple):
+    fingerprint: tuple
+    document: int
+    placemark_xml: str
+
+
+## The map served by the watch mode: a root KML with one NetworkLink per document, and the listings spread
+## over a fixed number of documents by id. After each poll only the placemarks of listings that changed are
+## rendered again, and only the documents whose placemarks changed get new content and a new ETag, so Google
+## Earth downloads nothing else when it refreshes the links
+class WatchMap:
+    def __init__(self, renderer: KMZ, n_documents: int = 16, refresh_seconds: int = 60, name: str = 'RentMap'):
+        self.renderer = renderer
+        self.n_documents = max(n_documents, 1)
+        self.refresh_seconds = refresh_seconds
+        self.name = name
+        self.lock = threading.Lock()
+        self.placemarks: dict[str, RenderedPlacemark] = {}
+        self.documents: dict[str, KmlDocument] = {}
+        for document in range(self.n_documents):
+            self.documents[self.get_document_path(document)] = self.get_kml_document(f'{name} {document + 1}', [])
+        self.documents['/markets.kml'] = self.get_kml_document(f'{name} - mercados', self.get_market_placemarks())
+        self.documents['/root.kml'] = self.get_kml_document(name, [], self.get_network_links_xml())
+        self.n_updates = 0
+
+    @staticmethod
+    def get_document_path(document: int) -> str:
+        return f'/listings/{document}.kml'
+
+    ## styles are repeated in every document, since a NetworkLink cannot use the styles of another file
+    def get_kml_document(self, name: str, placemarks: list[str], body: str = '') -> KmlDocument:
+        content = (self.renderer.kml.get_document_header(name) + self.renderer.kml.get_styles_xml() + body
+                   + ''.join(placemarks) + '</Document></kml>\n').encode('utf-8')
+        return KmlDocument(content, f'"{hashlib.sha1(content).hexdigest()[:20]}"')
+
+    def get_network_links_xml(self) -> str:
+        links = []
+        for path in ['/markets.kml', *(self.get_document_path(document) for document in range(self.n_documents))]:
+            ## relative links are resolved against the URL of the root document
+            links.append(f'<NetworkLink><name>{escape(path.strip("/"))}</name><Link><href>{escape(path.lstrip("/"))}</href>'
+                         f'<refreshMode>onInterval</refreshMode><refreshInterval>{self.refresh_seconds}</refreshInterval>'
+                         f'</Link></NetworkLink>\n')
+        return ''.join(links)
+
+    def get_market_placemarks(self) -> list[str]:
+        placemarks = []
+        for market in self.renderer.markets:
+            style_id = self.renderer.kml.get_style_id(market.icon, market.icon_color, market.icon_scale, market.label_scale)
+            placemarks.append(KmlWriter.get_placemark_xml(market.lat, market.lon, market.name,
+                                                          self.renderer.get_full_description(None, None), style_id))
+        return placemarks
+
+    def get_document(self, listing_id: str) -> int:
+        return zlib.crc32(listing_id.encode('utf-8')) % self.n_documents
+
+    ## everything the placemark of a listing is built from, updatedAt changes whenever the advertiser edits it
+    @staticmethod
+    def get_fingerprint(listing: Listing) -> tuple:
+        pricing_info = listing.listing.get_rental_pricing_info()
+        return (listing.listing.updatedAt, pricing_info, listing.priceChange, listing.duplicates, listing.proximity,
+                listing.account)
+
+    def render(self, listing: Listing) -> RenderedPlacemark | None:
+        placemark = self.renderer.get_listing_placemark(listing)
+        if placemark is None:
+            return None
+        lat, lon, description, icon, icon_color = placemark
+        style_id = self.renderer.kml.get_style_id(icon, icon_color)
+        return RenderedPlacemark(self.get_fingerprint(listing), self.get_document(listing.listing.id),
+                                 KmlWriter.get_placemark_xml(lat, lon, '', description, style_id))
+
+    ## replaces the listings on the map with `listings` and returns the number of documents that changed
+    def update(self, listings: Iterable[Listing]) -> int:
+        placemarks = {}
+        n_rendered = 0
+        with metrics.timer('kmz'):
+            for listing in listings:
+                listing_id = listing.listing.id
+                previous = self.placemarks.get(listing_id)
+                if previous is not None and previous.fingerprint == self.get_fingerprint(listing):
+                    placemarks[listing_id] = previous
+                    continue
+                placemark = self.render(listing)
+                if placemark is not None:
+                    placemarks[listing_id] = placemark
+                    n_rendered += 1
+
+            changed_documents = set()
+            for listing_id in placemarks.keys() | self.placemarks.keys():
+                previous, placemark = self.placemarks.get(listing_id), placemarks.get(listing_id)
+                if previous is None or placemark is None or previous.placemark_xml != placemark.placemark_xml:
+                    changed_documents.update(p.document for p in (previous, placemark) if p is not None)
+            documents = {}
+            for document in changed_documents:
+                ## sorted by id, so that the same placemarks always give the same content and ETag
+                document_placemarks = sorted((listing_id, placemark.placemark_xml) for listing_id, placemark
+                                             in placemarks.items() if placemark.document == document)
+                documents[self.get_document_path(document)] = self.get_kml_document(
+                    f'{self.name} {document + 1}', [placemark_xml for _, placemark_xml in document_placemarks])
+
+        with self.lock:
+            self.documents.update(documents)
+        n_removed = len(self.placemarks.keys() - placemarks.keys())
+        self.placemarks = placemarks
+        self.n_updates += 1
+        metrics.increment('placemarks_written_total', n_rendered)
+        logger.info(f'Watch update {self.n_updates} - {len(placemarks)} placemarks, {n_rendered} rendered, '
+                    f'{n_removed} removed, {len(changed_documents)} of {self.n_documents} documents changed')
+        return len(changed_documents)
+
+    def get(self, path: str) -> KmlDocument | None:
+        with self.lock:
+            return self.documents.get('/root.kml' if path in ('/', '') else path)
+
+
+class WatchRequestHandler(BaseHTTPRequestHandler):
+    server: 'WatchServer'
+
+    def log_message(self, format: str, *args):
+        logger.debug(f'{self.address_string()} - {format % args}')
+
+    def do_GET(self):
+        document = self.server.watch_map.get(self.path.split('?')[0])
+        if document is None:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        ## Google Earth sends the ETag back on each refresh, an unchanged document costs an empty 304
+        if document.etag in [etag.strip() for etag in self.headers.get('If-None-Match', '').split(',')]:
+            self.send_response(304)
+            self.send_header('ETag', document.etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/vnd.google-earth.kml+xml; charset=utf-8')
+        self.send_header('Content-Length', str(len(document.content)))
+        self.send_header('ETag', document.etag)
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        self.wfile.write(document.content)
+
+
+class WatchServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, watch_map: WatchMap, host: str = '127.0.0.1', port: int = 8080):
+        super().__init__((host, port), WatchRequestHandler)
+        self.watch_map = watch_map
+
+    def start(self) -> 'WatchServer':
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        logger.info(f'Serving the map at http://{self.server_address[0]}:{self.server_address[1]}/root.kml')
+        return self
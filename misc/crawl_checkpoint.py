@@ -0,0 +1,61 @@
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+
+from misc.response_cache import ResponseCache
+
+logger = logging.getLogger(__name__)
+
+
+## pages of an unfinished crawl, kept in <directory>/<search key>/ as they arrive together with a cursor
+## (the last page processed in order). A resumed crawl reads the stored pages back and only requests the
+## missing ones. The folder is removed when the crawl finishes
+class CrawlCheckpoint:
+    def __init__(self, directory: str, search_key: str, resume: bool = False):
+        self.directory = os.path.join(directory, search_key)
+        self.cursor_path = os.path.join(self.directory, 'cursor.json')
+        self.lock = threading.Lock()
+        self.cursor = {'search_key': search_key, 'started_at': time.time(), 'n_pages': 0, 'last_page': 0}
+        if resume and os.path.isfile(self.cursor_path):
+            with open(self.cursor_path, 'r', encoding='utf-8') as file:
+                self.cursor = json.load(file)
+            started_at = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.cursor['started_at']))
+            logger.info(f'Resuming the crawl started at {started_at}: {self.cursor["n_pages"]} pages already fetched, '
+                        f'last page processed: {self.cursor["last_page"]}')
+        else:
+            if resume:
+                logger.info(f'There is no interrupted crawl to resume in "{self.directory}", starting from page 1')
+            self.clear()
+        ## the user parameter changes between runs, pages are found by the rest of the URL
+        self.pages = ResponseCache(os.path.join(self.directory, 'pages'))
+        self.write_cursor()
+
+    def get(self, url: str) -> bytes | None:
+        return self.pages.get(url)
+
+    def put(self, url: str, content: bytes):
+        self.pages.put(url, content)
+        with self.lock:
+            self.cursor['n_pages'] += 1
+            self.write_cursor()
+
+    def set_last_page(self, page_number: int):
+        with self.lock:
+            self.cursor['last_page'] = page_number
+            self.write_cursor()
+
+    def write_cursor(self):
+        with open(f'{self.cursor_path}.tmp', 'w', encoding='utf-8') as file:
+            json.dump(self.cursor, file)
+        os.replace(f'{self.cursor_path}.tmp', self.cursor_path)
+
+    def clear(self):
+        if os.path.isdir(self.directory):
+            shutil.rmtree(self.directory)
+
+    def finish(self):
+        self.clear()
+        logger.info(f'Crawl finished, checkpoint "{self.directory}" removed')
@@ -0,0 +1,146 @@
+import logging
+
+import numpy as np
+
+from model.listing_model import Duplicates, Listing
+
+logger = logging.getLogger(__name__)
+
+
+## groups ads of the same property published by different advertisers. Listings are only compared inside
+## a block (rounded coordinates, floor and area), and inside a block only when their MinHash signatures
+## share a band (LSH), so the cost grows with the number of listings instead of the number of pairs
+class ListingDeduplicator:
+    shingle_size = 3
+    max_shingles_per_chunk = 1 << 18
+
+    def __init__(self, threshold: float = 0.5, num_perm: int = 32, bands: int = 8, coordinate_decimals: int = 3,
+                 seed: int = 1):
+        if num_perm % bands != 0:
+            logger.error('num_perm must be a multiple of bands')
+            raise Exception('num_perm must be a multiple of bands')
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.coordinate_decimals = coordinate_decimals
+        rng = np.random.default_rng(seed)
+        ## a * x + b mod 2 ** 32 with an odd a is a permutation of the 32 bit shingle hashes
+        self.a = rng.integers(0, 1 << 31, num_perm, dtype=np.uint32) * np.uint32(2) + np.uint32(1)
+        self.b = rng.integers(0, 1 << 32, num_perm, dtype=np.uint32)
+        self.band_multipliers = rng.integers(0, 1 << 63, self.rows, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+
+    def get_block_key(self, listing: Listing) -> tuple | None:
+        address_point = listing.get_address_point()
+        if address_point is None or address_point.is_address_approximated() or not listing.listing.usableAreas:
+            return None
+        lat, lon = address_point.get_lat_lon()
+        return (round(lat, self.coordinate_decimals), round(lon, self.coordinate_decimals), listing.listing.unitFloor,
+                int(listing.listing.usableAreas[0]))
+
+    @staticmethod
+    def get_tokens(listing: Listing) -> list[str]:
+        return f'{listing.listing.title} {listing.listing.description}'.lower().split()
+
+    ## word n-gram shingles of every document, hashed to 32 bits, with the index of the first shingle of each one.
+    ## The n-grams are computed over the tokens of all documents at once and the ones crossing a document
+    ## boundary are dropped. Python's str hash is only stable inside one process, which is all that is needed here
+    def get_shingles(self, tokens: list[str], lengths: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        token_starts = np.cumsum(lengths) - lengths
+        hashes = np.fromiter(map(hash, tokens), dtype=np.int64, count=len(tokens)).view(np.uint64)
+        n_positions = len(hashes) - self.shingle_size + 1
+        shingles = np.zeros(n_positions, dtype=np.uint64)
+        for i in range(self.shingle_size):
+            shingles = shingles * np.uint64(1000003) + hashes[i:i + n_positions]
+        document_of_position = np.repeat(np.arange(len(lengths)), lengths)[:n_positions]
+        valid = np.arange(n_positions) - token_starts[document_of_position] <= (lengths - self.shingle_size)[document_of_position]
+        counts = lengths - self.shingle_size + 1
+        shingles = shingles[valid]
+        return ((shingles >> np.uint64(32)) ^ shingles).astype(np.uint32), np.cumsum(counts) - counts
+
+    def get_signatures(self, tokens: list[str], lengths: np.ndarray) -> np.ndarray:
+        shingles, starts = self.get_shingles(tokens, lengths)
+        n_documents = len(lengths)
+        signatures = np.empty((n_documents, self.num_perm), dtype=np.uint32)
+        ends = np.append(starts[1:], len(shingles))
+        first = 0
+        while first < n_documents:
+            ## whole documents per chunk, so that each minimum is taken over all of its shingles
+            last = max(int(np.searchsorted(ends, starts[first] + self.max_shingles_per_chunk, side='right')), first + 1)
+            chunk = shingles[starts[first]:ends[last - 1]]
+            hashes = self.a[:, None] * chunk[None, :] + self.b[:, None]
+            signatures[first:last] = np.minimum.reduceat(hashes, starts[first:last] - starts[first], axis=1).T
+            first = last
+        return signatures
+
+    def find_groups(self, listings: list[Listing]) -> list[list[int]]:
+        indices = []
+        block_ids = []
+        tokens = []
+        lengths = []
+        blocks = {}
+        for i, listing in enumerate(listings):
+            block_key = self.get_block_key(listing)
+            if block_key is None:
+                continue
+            listing_tokens = self.get_tokens(listing)
+            if len(listing_tokens) < self.shingle_size:
+                continue
+            indices.append(i)
+            block_ids.append(blocks.setdefault(block_key, len(blocks)))
+            tokens += listing_tokens
+            lengths.append(len(listing_tokens))
+        if not indices:
+            return []
+        signatures = self.get_signatures(tokens, np.array(lengths, dtype=np.int64))
+
+        block_ids = np.array(block_ids, dtype=np.int64)
+        parents = list(range(len(indices)))
+
+        def find(document: int) -> int:
+            while parents[document] != document:
+                parents[document] = parents[parents[document]]
+                document = parents[document]
+            return document
+
+        for band in range(self.bands):
+            band_signatures = signatures[:, band * self.rows:(band + 1) * self.rows].astype(np.uint64)
+            band_hashes = (band_signatures * self.band_multipliers[None, :]).sum(axis=1)
+            ## documents of the same block with the same band end up next to each other once sorted
+            order = np.lexsort((band_hashes, block_ids))
+            same_bucket = ((block_ids[order[1:]] == block_ids[order[:-1]])
+                           & (band_hashes[order[1:]] == band_hashes[order[:-1]]))
+            firsts, seconds = order[:-1][same_bucket], order[1:][same_bucket]
+            ## the share of equal MinHash values estimates the Jaccard similarity of the shingles
+            similarities = (signatures[firsts] == signatures[seconds]).mean(axis=1)
+            for first, second in zip(firsts[similarities >= self.threshold], seconds[similarities >= self.threshold]):
+                parents[find(second)] = find(first)
+
+        groups = {}
+        for document in range(len(indices)):
+            groups.setdefault(find(document), []).append(indices[document])
+        return [group for group in groups.values() if len(group) > 1]
+
+    ## returns one flag per listing, False for the ads collapsed into another one. The cheapest ad of each
+    ## group is kept and receives the links, advertisers and rent spread of the others
+    def deduplicate(self, listings: list[Listing]) -> list[bool]:
+        keep = [True] * len(listings)
+        for listing in listings:
+            listing.duplicates = None
+        groups = self.find_groups(listings)
+        for group in groups:
+            prices = {i: listings[i].listing.get_rental_pricing_info().price
+                      for i in group if listings[i].listing.get_rental_pricing_info() is not None}
+            canonical = min(prices, key=prices.get) if prices else group[0]
+            others = [i for i in group if i != canonical]
+            listings[canonical].duplicates = Duplicates(
+                [listings[i].link.href for i in others],
+                [listings[i].account.name if listings[i].account is not None else 'Not informed' for i in others],
+                min(prices.values(), default=0),
+                max(prices.values(), default=0),
+            )
+            for i in others:
+                keep[i] = False
+        logger.info(f'Deduplication - {sum(len(group) for group in groups)} listings in {len(groups)} groups of '
+                    f'duplicated ads, {len(listings) - sum(keep)} removed')
+        return keep
@@ -0,0 +1,143 @@
+import logging
+from typing import Any, Callable, Iterable, Iterator
+
+import numpy as np
+
+from misc.metrics import metrics
+from model.listing_model import Listing
+from model.listing_table import ListingTable
+
+logger = logging.getLogger(__name__)
+
+
+class FilterEngine:
+    def __init__(self, filters: Any):
+        self.rent_price_min = self.get_number(filters, 'rent_price_min', 0)
+        self.rent_price_max = self.get_number(filters, 'rent_price_max', 9999999)
+        if self.rent_price_max <= self.rent_price_min:
+            logger.error('rent_price_max must be greater than rent_price_min')
+            raise Exception('rent_price_max must be greater than rent_price_min')
+        self.neighborhood = filters.get('neighborhood', '').strip()
+        self.pets_allowed = True if filters.get('pets_allowed', '').strip() == 'True' else False
+        self.min_unit_floor = int(self.get_number(filters, 'min_unit_floor', 0))
+        self.area_min = self.get_number(filters, 'area_min', None)
+        self.area_max = self.get_number(filters, 'area_max', None)
+        self.bedrooms_min = self.get_number(filters, 'bedrooms_min', None)
+        self.bedrooms_max = self.get_number(filters, 'bedrooms_max', None)
+        self.total_cost_max = self.get_number(filters, 'total_cost_max', None)
+        self.max_poi_distance = self.get_number(filters, 'max_poi_distance', None)
+        self.predicates = self.compile()
+        self.listing_predicates = self.compile_listing_predicates()
+
+    @staticmethod
+    def get_number(filters: Any, name: str, default: float | None) -> float | None:
+        value = filters.get(name, '').strip()
+        return max(float(value), 0) if value.isdigit() else default
+
+    ## (name, ListingTable column, minimum, maximum) of the filters on a range of values
+    def get_ranges(self) -> list[tuple[str, str, float | None, float | None]]:
+        return [
+            ('area', 'usable_area', self.area_min, self.area_max),
+            ('bedrooms', 'bedrooms', self.bedrooms_min, self.bedrooms_max),
+            ('total_cost', 'total_monthly_cost', None, self.total_cost_max),
+            ('poi_distance', 'nearest_poi_distance', None, self.max_poi_distance),
+        ]
+
+    ## value of a ListingTable column for one listing, None where the table has NaN
+    listing_values = {
+        'usable_area': lambda listing: listing.listing.usableAreas[0] if listing.listing.usableAreas else None,
+        'bedrooms': lambda listing: listing.listing.bedrooms[0] if listing.listing.bedrooms else None,
+        'total_monthly_cost': lambda listing: (None if (rent := listing.listing.get_rental_pricing_info()) is None
+                                               else rent.price + rent.monthlyCondoFee + rent.yearlyIptu / 12),
+        'nearest_poi_distance': lambda listing: listing.proximity.nearestDistance if listing.proximity is not None else None,
+    }
+
+    ## each predicate maps a ListingTable to a boolean mask, only the active filters are compiled
+    def compile(self) -> dict[str, Callable[[ListingTable], np.ndarray]]:
+        predicates = {
+            'rent_price': lambda table: table['has_rent']
+                                        & (table['price'] >= self.rent_price_min)
+                                        & (table['price'] <= self.rent_price_max),
+        }
+        if self.neighborhood:
+            predicates['neighborhood'] = lambda table: table.is_neighborhood(self.neighborhood)
+        if self.pets_allowed:
+            predicates['pets_allowed'] = lambda table: table.has_amenity('PETS_ALLOWED')
+        predicates['min_unit_floor'] = lambda table: table['floor'] >= self.min_unit_floor
+        ## comparisons against NaN are False, so listings missing a ranged value are filtered out
+        for name, column, minimum, maximum in self.get_ranges():
+            if minimum is not None:
+                predicates[f'{name}_min'] = lambda table, column=column, minimum=minimum: table[column] >= minimum
+            if maximum is not None:
+                predicates[f'{name}_max'] = lambda table, column=column, maximum=maximum: table[column] <= maximum
+        return predicates
+
+    ## the same predicates over a single listing. Building a ListingTable costs more than filtering the
+    ## listings one by one, so pages that are only filtered once use these, and the masks are kept for
+    ## tables that are filtered several times (see ProfileRenderer)
+    def compile_listing_predicates(self) -> dict[str, Callable[[Listing], bool]]:
+        def is_rent_price_ok(listing: Listing) -> bool:
+            rent = listing.listing.get_rental_pricing_info()
+            return rent is not None and self.rent_price_min <= rent.price <= self.rent_price_max
+
+        predicates = {'rent_price': is_rent_price_ok}
+        if self.neighborhood:
+            predicates['neighborhood'] = lambda listing: (listing.listing.address is not None
+                                                          and listing.listing.address.neighborhood == self.neighborhood)
+        if self.pets_allowed:
+            predicates['pets_allowed'] = lambda listing: 'PETS_ALLOWED' in listing.listing.amenities
+        predicates['min_unit_floor'] = lambda listing: listing.listing.unitFloor >= self.min_unit_floor
+        for name, column, minimum, maximum in self.get_ranges():
+            get_value = self.listing_values[column]
+            if minimum is not None:
+                predicates[f'{name}_min'] = lambda listing, get_value=get_value, minimum=minimum: (
+                    (value := get_value(listing)) is not None and value >= minimum)
+            if maximum is not None:
+                predicates[f'{name}_max'] = lambda listing, get_value=get_value, maximum=maximum: (
+                    (value := get_value(listing)) is not None and value <= maximum)
+        return predicates
+
+    def get_mask(self, table: ListingTable) -> np.ndarray:
+        mask = np.ones(len(table), dtype=bool)
+        ## filter_passed_total counts the listings that pass a predicate and every predicate before it, like
+        ## filter_listings does
+        metrics.increment('filter_input_total', len(table))
+        for name, predicate in self.predicates.items():
+            mask &= predicate(table)
+            metrics.increment('filter_passed_total', int(mask.sum()), {'predicate': name})
+        metrics.increment('filter_output_total', int(mask.sum()))
+        return mask
+
+    ## each predicate only runs on the listings kept by the previous ones
+    def filter_listings(self, listings: list[Listing]) -> list[Listing]:
+        metrics.increment('filter_input_total', len(listings))
+        for name, predicate in self.listing_predicates.items():
+            listings = list(filter(predicate, listings))
+            metrics.increment('filter_passed_total', len(listings), {'predicate': name})
+        metrics.increment('filter_output_total', len(listings))
+        return listings
+
+    def log_filters(self):
+        logger.info(f'Applying rent price filter - Min: {self.rent_price_min}, Max: {self.rent_price_max}')
+        if self.neighborhood:
+            logger.info(f'Applying neighborhood filter for "{self.neighborhood}"')
+        else:
+            logger.info(f'Neighborhood not selected - no filters will be applied for neighborhood')
+        logger.info(f'PETS_ALLOWED filter: "{"" if self.pets_allowed else "not "}allowed"')
+        logger.info(f'Min floor filter: {self.min_unit_floor}')
+        for name in ('area_min', 'area_max', 'bedrooms_min', 'bedrooms_max', 'total_cost_max', 'max_poi_distance'):
+            if getattr(self, name) is not None:
+                logger.info(f'{name} filter: {getattr(self, name)}')
+
+    ## streaming filter stage, each page is filtered listing by listing as it arrives
+    def filter_pages(self, pages: Iterable[list[Listing]]) -> Iterator[list[Listing]]:
+        self.log_filters()
+        n_listings_before_filter = 0
+        n_listings_after_filter = 0
+        for page in pages:
+            with metrics.timer('filter'):
+                filtered_page = self.filter_listings(page)
+            n_listings_before_filter += len(page)
+            n_listings_after_filter += len(filtered_page)
+            yield filtered_page
+        logger.info(f'Listing count - Before filtering: {n_listings_before_filter}, After filtering: {n_listings_after_filter}')
@@ -0,0 +1,142 @@
+import logging
+import os
+import sqlite3
+import time
+from typing import NamedTuple
+
+from model.listing_model import Listing, PriceChange
+
+logger = logging.getLogger(__name__)
+
+
+class RunDiff(NamedTuple):
+    new_ids: list[str]
+    removed_ids: list[str]
+    ## (listing id, previous price, price)
+    price_changes: list[tuple[str, float | None, float | None]]
+
+
+## every run of a search is kept, with one row per listing seen in it, so any two runs can be compared
+class HistoryStore:
+    def __init__(self, path: str = 'data/history.db'):
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+            logger.info(f'"{directory}" folder created')
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript('''
+            CREATE TABLE IF NOT EXISTS runs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                search_key TEXT NOT NULL,
+                name TEXT,
+                started_at REAL NOT NULL,
+                finished_at REAL
+            );
+            CREATE TABLE IF NOT EXISTS observations (
+                run_id INTEGER NOT NULL REFERENCES runs (id),
+                listing_id TEXT NOT NULL,
+                price REAL,
+                total_monthly_cost REAL,
+                href TEXT,
+                PRIMARY KEY (run_id, listing_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS runs_search_started_at ON runs (search_key, started_at);
+            CREATE INDEX IF NOT EXISTS observations_listing_id ON observations (listing_id, run_id);
+            CREATE INDEX IF NOT EXISTS observations_price ON observations (run_id, price);
+        ''')
+
+    def start_run(self, search_key: str, name: str = '') -> int:
+        with self.connection:
+            cursor = self.connection.execute(
+                'INSERT INTO runs (search_key, name, started_at) VALUES (?, ?, ?)', (search_key, name, time.time())
+            )
+        return cursor.lastrowid
+
+    def finish_run(self, run_id: int):
+        with self.connection:
+            self.connection.execute('UPDATE runs SET finished_at = ? WHERE id = ?', (time.time(), run_id))
+
+    ## unfinished runs only hold part of the search, so they are never used as a reference
+    def get_previous_run(self, search_key: str, run_id: int) -> int | None:
+        row = self.connection.execute('''
+            SELECT id FROM runs WHERE search_key = ? AND id < ? AND finished_at IS NOT NULL
+            ORDER BY started_at DESC LIMIT 1
+        ''', (search_key, run_id)).fetchone()
+        return row[0] if row is not None else None
+
+    def get_runs(self, search_key: str) -> list[tuple[int, str, float, float | None]]:
+        return self.connection.execute(
+            'SELECT id, name, started_at, finished_at FROM runs WHERE search_key = ? ORDER BY started_at', (search_key,)
+        ).fetchall()
+
+    def add_listings(self, run_id: int, listings: list[Listing]):
+        rows = []
+        for listing in listings:
+            rent = listing.listing.get_rental_pricing_info()
+            rows.append((
+                run_id,
+                listing.listing.id,
+                rent.price if rent is not None else None,
+                rent.price + rent.monthlyCondoFee + rent.yearlyIptu / 12 if rent is not None else None,
+                listing.link.href if listing.link is not None else None,
+            ))
+        with self.connection:
+            self.connection.executemany('''
+                INSERT OR REPLACE INTO observations (run_id, listing_id, price, total_monthly_cost, href)
+                VALUES (?, ?, ?, ?, ?)
+            ''', rows)
+
+    def get_prices(self, run_id: int, ids: list[str]) -> dict[str, float | None]:
+        placeholders = ','.join('?' * len(ids))
+        rows = self.connection.execute(
+            f'SELECT listing_id, price FROM observations WHERE run_id = ? AND listing_id IN ({placeholders})',
+            [run_id, *ids],
+        )
+        return dict(rows.fetchall())
+
+    ## flags listings that were not in the previous run or whose rent went down since it
+    def annotate(self, previous_run_id: int | None, listings: list[Listing]):
+        for listing in listings:
+            listing.priceChange = None
+        if previous_run_id is None or not listings:
+            return
+        previous_prices = self.get_prices(previous_run_id, [listing.listing.id for listing in listings])
+        for listing in listings:
+            rent = listing.listing.get_rental_pricing_info()
+            price = rent.price if rent is not None else None
+            if listing.listing.id not in previous_prices:
+                listing.priceChange = PriceChange(None, price)
+            elif price is not None and previous_prices[listing.listing.id] is not None \
+                    and price < previous_prices[listing.listing.id]:
+                listing.priceChange = PriceChange(previous_prices[listing.listing.id], price)
+
+    def diff(self, previous_run_id: int, run_id: int) -> RunDiff:
+        new_ids = [row[0] for row in self.connection.execute('''
+            SELECT listing_id FROM observations WHERE run_id = ?
+            EXCEPT
+            SELECT listing_id FROM observations WHERE run_id = ?
+        ''', (run_id, previous_run_id))]
+        removed_ids = [row[0] for row in self.connection.execute('''
+            SELECT listing_id FROM observations WHERE run_id = ?
+            EXCEPT
+            SELECT listing_id FROM observations WHERE run_id = ?
+        ''', (previous_run_id, run_id))]
+        price_changes = self.connection.execute('''
+            SELECT current.listing_id, previous.price, current.price
+            FROM observations AS current
+            JOIN observations AS previous ON previous.run_id = ? AND previous.listing_id = current.listing_id
+            WHERE current.run_id = ? AND previous.price IS NOT current.price
+        ''', (previous_run_id, run_id)).fetchall()
+        return RunDiff(new_ids, removed_ids, price_changes)
+
+    ## (run start time, rent price) for every run in which the listing was seen
+    def get_price_history(self, listing_id: str) -> list[tuple[float, float | None]]:
+        return self.connection.execute('''
+            SELECT runs.started_at, observations.price
+            FROM observations JOIN runs ON runs.id = observations.run_id
+            WHERE observations.listing_id = ?
+            ORDER BY runs.started_at
+        ''', (listing_id,)).fetchall()
+
+    def close(self):
+        self.connection.close()
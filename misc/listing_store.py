@@ -0,0 +1,111 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+import zlib
+from typing import Iterator
+
+logger = logging.getLogger(__name__)
+
+
+class ListingStore:
+    def __init__(self, path: str = 'data/listings.db'):
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+            logger.info(f'"{directory}" folder created')
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript('''
+            CREATE TABLE IF NOT EXISTS listings (
+                search_key TEXT NOT NULL,
+                id TEXT NOT NULL,
+                updated_at TEXT,
+                content_hash TEXT NOT NULL,
+                payload BLOB NOT NULL,
+                last_seen REAL NOT NULL,
+                PRIMARY KEY (search_key, id)
+            );
+            CREATE TABLE IF NOT EXISTS searches (
+                search_key TEXT PRIMARY KEY,
+                last_full_crawl REAL NOT NULL
+            );
+        ''')
+
+    @staticmethod
+    def get_listing_id(listing: dict) -> str:
+        return str(listing['listing']['id'])
+
+    @staticmethod
+    def get_content_hash(listing: dict) -> str:
+        content = json.dumps(listing, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+    def get_known_hashes(self, search_key: str, ids: list[str]) -> dict[str, str]:
+        placeholders = ','.join('?' * len(ids))
+        rows = self.connection.execute(
+            f'SELECT id, content_hash FROM listings WHERE search_key = ? AND id IN ({placeholders})',
+            [search_key, *ids],
+        )
+        return dict(rows.fetchall())
+
+    ## a page is unchanged when every listing in it is already stored with the same content
+    def is_page_unchanged(self, search_key: str, listings: list[dict]) -> bool:
+        if not listings:
+            return False
+        known_hashes = self.get_known_hashes(search_key, [self.get_listing_id(listing) for listing in listings])
+        return all(known_hashes.get(self.get_listing_id(listing)) == self.get_content_hash(listing)
+                   for listing in listings)
+
+    def upsert(self, search_key: str, listings: list[dict]):
+        now = time.time()
+        rows = [(
+            search_key,
+            self.get_listing_id(listing),
+            listing['listing'].get('updatedAt'),
+            self.get_content_hash(listing),
+            zlib.compress(json.dumps(listing).encode('utf-8')),
+            now,
+        ) for listing in listings]
+        with self.connection:
+            self.connection.executemany('''
+                INSERT INTO listings (search_key, id, updated_at, content_hash, payload, last_seen)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (search_key, id) DO UPDATE SET
+                    updated_at = excluded.updated_at,
+                    content_hash = excluded.content_hash,
+                    payload = excluded.payload,
+                    last_seen = excluded.last_seen
+            ''', rows)
+
+    def iter_listings(self, search_key: str, exclude_ids: set[str] = frozenset()) -> Iterator[dict]:
+        rows = self.connection.execute(
+            'SELECT id, payload FROM listings WHERE search_key = ? ORDER BY updated_at DESC', (search_key,)
+        )
+        for listing_id, payload in rows:
+            if listing_id not in exclude_ids:
+                yield json.loads(zlib.decompress(payload))
+
+    def needs_full_crawl(self, search_key: str, max_age_seconds: float) -> bool:
+        row = self.connection.execute(
+            'SELECT last_full_crawl FROM searches WHERE search_key = ?', (search_key,)
+        ).fetchone()
+        return row is None or time.time() - row[0] > max_age_seconds
+
+    ## after a full crawl, listings that were not seen anymore have been removed from the portal
+    def finish_full_crawl(self, search_key: str, seen_ids: set[str]):
+        known_ids = {row[0] for row in self.connection.execute(
+            'SELECT id FROM listings WHERE search_key = ?', (search_key,)
+        )}
+        removed_ids = [(search_key, listing_id) for listing_id in known_ids - seen_ids]
+        with self.connection:
+            self.connection.executemany('DELETE FROM listings WHERE search_key = ? AND id = ?', removed_ids)
+            self.connection.execute('''
+                INSERT INTO searches (search_key, last_full_crawl) VALUES (?, ?)
+                ON CONFLICT (search_key) DO UPDATE SET last_full_crawl = excluded.last_full_crawl
+            ''', (search_key, time.time()))
+        logger.info(f'Full crawl stored - {len(removed_ids)} listings no longer available were removed from the store')
+
+    def close(self):
+        self.connection.close()
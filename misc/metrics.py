@@ -0,0 +1,123 @@
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Iterator
+
+logger = logging.getLogger(__name__)
+
+
+## counters, stage timers and histograms of one run, shared by every module through the `metrics` instance.
+## Stage timers add up the time spent in each stage, so stages that run in worker threads can exceed the wall time
+class Metrics:
+    latency_buckets = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started_at = time.time()
+        self.counters = {}
+        self.histograms = {}
+
+    @staticmethod
+    def get_key(name: str, labels: dict | None) -> tuple:
+        return name, tuple(sorted(labels.items())) if labels else ()
+
+    def increment(self, name: str, value: float = 1, labels: dict | None = None):
+        key = self.get_key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, labels: dict | None = None):
+        key = self.get_key(name, labels)
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = {'buckets': [0] * (len(self.latency_buckets) + 1), 'sum': 0.0, 'count': 0}
+            histogram = self.histograms[key]
+            histogram['buckets'][bisect_left(self.latency_buckets, value)] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    @contextmanager
+    def timer(self, stage: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.increment('stage_seconds', time.perf_counter() - start, {'stage': stage})
+
+    def get(self, name: str, labels: dict | None = None) -> float:
+        return self.counters.get(self.get_key(name, labels), 0)
+
+    def to_dict(self) -> dict:
+        with self.lock:
+            counters = [{'name': name, 'labels': dict(labels), 'value': value}
+                        for (name, labels), value in sorted(self.counters.items())]
+            histograms = [{'name': name, 'labels': dict(labels), 'buckets': dict(zip([*map(str, self.latency_buckets), '+Inf'],
+                                                                                     histogram['buckets'])),
+                           'sum': histogram['sum'], 'count': histogram['count']}
+                          for (name, labels), histogram in sorted(self.histograms.items())]
+        return {'started_at': self.started_at, 'finished_at': time.time(), 'counters': counters, 'histograms': histograms}
+
+    @staticmethod
+    def get_prometheus_labels(labels: tuple, extra: tuple = ()) -> str:
+        labels = [*labels, *extra]
+        if not labels:
+            return ''
+        return '{' + ','.join(f'{name}="{str(value)}"' for name, value in labels) + '}'
+
+    ## Prometheus text exposition format, e.g. for the node_exporter textfile collector
+    def to_prometheus(self) -> str:
+        lines = []
+        previous_name = None
+        with self.lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                if name != previous_name:
+                    lines.append(f'# TYPE rent_map_{name} counter')
+                    previous_name = name
+                lines.append(f'rent_map_{name}{self.get_prometheus_labels(labels)} {value}')
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                if name != previous_name:
+                    lines.append(f'# TYPE rent_map_{name} histogram')
+                    previous_name = name
+                cumulative = 0
+                for bucket, count in zip([*map(str, self.latency_buckets), '+Inf'], histogram['buckets']):
+                    cumulative += count
+                    lines.append(f'rent_map_{name}_bucket{self.get_prometheus_labels(labels, (("le", bucket),))} {cumulative}')
+                lines.append(f'rent_map_{name}_sum{self.get_prometheus_labels(labels)} {histogram["sum"]}')
+                lines.append(f'rent_map_{name}_count{self.get_prometheus_labels(labels)} {histogram["count"]}')
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def write_atomic(path: str, content: str):
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(f'{path}.tmp', 'w', encoding='utf-8') as file:
+            file.write(content)
+        os.replace(f'{path}.tmp', path)
+
+    def write(self, json_path: str = '', prometheus_path: str = ''):
+        if json_path:
+            self.write_atomic(json_path, json.dumps(self.to_dict(), indent=4))
+            logger.info(f'Metrics written to {json_path}')
+        if prometheus_path:
+            self.write_atomic(prometheus_path, self.to_prometheus())
+            logger.info(f'Prometheus metrics written to {prometheus_path}')
+
+    def log_summary(self):
+        decode_seconds = self.get('stage_seconds', {'stage': 'decode'})
+        n_parsed = self.get('listings_parsed_total')
+        listings_per_second = n_parsed / decode_seconds if decode_seconds else 0
+        logger.info(f'Metrics - {int(self.get("requests_total"))} requests, '
+                    f'{self.get("response_bytes_total") / 1024 / 1024:.1f} MiB received, '
+                    f'{int(n_parsed)} listings parsed ({listings_per_second:.0f} listings/s), '
+                    f'{int(self.get("placemarks_written_total"))} placemarks written')
+        for (name, labels), value in sorted(self.counters.items()):
+            if name == 'stage_seconds':
+                logger.info(f'Metrics - {dict(labels)["stage"]} stage: {value:.2f} s')
+
+
+metrics = Metrics()
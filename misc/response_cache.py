@@ -0,0 +1,91 @@
+import gzip
+import hashlib
+import logging
+import os
+import threading
+import time
+import zlib
+
+from misc.url_parser import URLParser
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    def __init__(self, directory: str = 'cache', ttl_seconds: float = 0, max_size_bytes: int = 0,
+                 volatile_params: tuple = ('user',)):
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds
+        self.max_size_bytes = max_size_bytes
+        self.volatile_params = set(volatile_params)
+        self.lock = threading.Lock()
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+            logger.info(f'"{self.directory}" folder created')
+        self.size_bytes = sum(os.path.getsize(path) for path in self.get_entries())
+
+    def get_path(self, url: str) -> str:
+        normalized_url = URLParser(url).get_normalized_url(self.volatile_params)
+        key = hashlib.sha256(normalized_url.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, f'{key}.json.gz')
+
+    def get_entries(self) -> list[str]:
+        return [os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith('.json.gz')]
+
+    def get(self, url: str) -> bytes | None:
+        path = self.get_path(url)
+        with self.lock:
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                return None
+            now = time.time()
+            ## mtime is the time the response was stored, atime the last time it was read (used for LRU)
+            if self.ttl_seconds and now - stat.st_mtime > self.ttl_seconds:
+                logger.debug(f'Cached response for {url} expired')
+                self.remove(path, stat.st_size)
+                return None
+            os.utime(path, (now, stat.st_mtime))
+        ## the entry can be evicted by another worker before it is read, or be truncated by an interrupted run
+        try:
+            with gzip.open(path, 'rb') as cache_file:
+                return cache_file.read()
+        except (OSError, EOFError, zlib.error) as e:
+            logger.warning(f'Cached response for {url} could not be read ({e!r}), fetching it again')
+            with self.lock:
+                try:
+                    self.remove(path, os.path.getsize(path))
+                except FileNotFoundError:
+                    pass
+            return None
+
+    def put(self, url: str, content: bytes):
+        path = self.get_path(url)
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        with gzip.open(tmp_path, 'wb') as cache_file:
+            cache_file.write(content)
+        with self.lock:
+            previous_size = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(tmp_path, path)
+            self.size_bytes += os.path.getsize(path) - previous_size
+            self.evict()
+
+    def remove(self, path: str, size: int):
+        try:
+            os.remove(path)
+            self.size_bytes -= size
+        except FileNotFoundError:
+            pass
+
+    def evict(self):
+        if not self.max_size_bytes or self.size_bytes <= self.max_size_bytes:
+            return
+        entries = [(os.stat(path), path) for path in self.get_entries()]
+        entries.sort(key=lambda entry: entry[0].st_atime)
+        n_evicted = 0
+        for stat, path in entries:
+            if self.size_bytes <= self.max_size_bytes:
+                break
+            self.remove(path, stat.st_size)
+            n_evicted += 1
+        logger.info(f'Evicted {n_evicted} cached responses to keep the cache under {self.max_size_bytes} bytes')
@@ -1,47 +1,144 @@
+import gzip
 import json
 import logging
 import os.path
 from datetime import datetime
+from textwrap import indent
+from typing import IO, TextIO
+
+import numpy as np
 
 from model.listing_model import Listing
+from model.listing_table import ListingTable
 
 logger = logging.getLogger(__name__)
 
 
 class SaveData:
-    def __init__(self):
-        now = datetime.now()
-        formatted_now = now.strftime("%Y%m%d-%H%M%S")
-        self.subfolder_name = f'{formatted_now}'
-        self.listings_json = []
-        self.listings_csv = []
+    ## a batch run writes each search to its own folder, e.g. data/<timestamp>/<search name>
+    def __init__(self, subfolder_name: str | None = None):
+        if subfolder_name is None:
+            now = datetime.now()
+            formatted_now = now.strftime("%Y%m%d-%H%M%S")
+            subfolder_name = f'{formatted_now}'
+        self.subfolder_name = subfolder_name
+        self.json_file: TextIO | None = None
+        self.csv_file: TextIO | None = None
+        self.jsonl_file: TextIO | None = None
+        self.n_listings_json = 0
+        self.n_listings_csv = 0
+        self.n_listings_jsonl = 0
+        self.tables = []
+        self.ids = []
+        self.hrefs = []
+
+    ## every file is written to <name>.tmp and only renamed by save_* once the search is complete. An
+    ## interrupted run calls discard instead, so it never leaves a truncated file behind
+    def open_output(self, file_name: str, compressed: bool = False, binary: bool = False) -> IO:
+        self.create_directory_structure()
+        path = f'data/{self.subfolder_name}/{file_name}.tmp'
+        if compressed:
+            return gzip.open(path, 'wt', encoding='utf-8', compresslevel=6)
+        if binary:
+            return open(path, 'wb')
+        return open(path, 'w', encoding='utf-8')
 
+    def close_output(self, file: IO, file_name: str):
+        file.close()
+        os.replace(f'data/{self.subfolder_name}/{file_name}.tmp', f'data/{self.subfolder_name}/{file_name}')
+
+    ## removes the .tmp files of a search that did not finish
+    def discard(self):
+        n_discarded = 0
+        for attribute, file_name in [('json_file', 'listings.json'), ('csv_file', 'listings.csv'),
+                                     ('jsonl_file', 'listings.jsonl.gz')]:
+            file = getattr(self, attribute)
+            if file is None:
+                continue
+            file.close()
+            os.remove(f'data/{self.subfolder_name}/{file_name}.tmp')
+            setattr(self, attribute, None)
+            n_discarded += 1
+        self.tables = []
+        self.ids = []
+        self.hrefs = []
+        if n_discarded > 0:
+            logging.warning(f'The search did not finish, the partial files in "data/{self.subfolder_name}" were removed')
+            ## the folder is only kept when it holds something else, e.g. the searches of a batch
+            if not os.listdir(f'data/{self.subfolder_name}'):
+                os.rmdir(f'data/{self.subfolder_name}')
+
+    ## listings are written as soon as they are added, so only the current page is kept in memory
     def add_listings_json(self, listings: list[dict]):
-        self.listings_json += listings
+        if self.json_file is None:
+            self.json_file = self.open_output('listings.json')
+            self.json_file.write('[')
+        for listing in listings:
+            separator = ',\n' if self.n_listings_json > 0 else '\n'
+            self.json_file.write(separator + indent(json.dumps(listing, indent=4), '    '))
+            self.n_listings_json += 1
+
+    ## one raw listing per line, so the file can be appended to and read back line by line
+    def add_listings_jsonl(self, listings: list[dict]):
+        if self.jsonl_file is None:
+            self.jsonl_file = self.open_output('listings.jsonl.gz', compressed=True)
+        for listing in listings:
+            self.jsonl_file.write(json.dumps(listing, ensure_ascii=False, separators=(',', ':')) + '\n')
+            self.n_listings_jsonl += 1
 
-    def add_listings_csv(self, listings: list[Listing]):
-        self.listings_csv += listings
+    def add_listings_csv(self, listings: list[Listing], base_url: str):
+        if self.csv_file is None:
+            self.csv_file = self.open_output('listings.csv')
+            self.csv_file.write(Listing.get_csv_headers() + '\n')
+        for listing in listings:
+            line = listing.get_csv_line(base_url)
+            if line is not None:
+                self.csv_file.write(line + '\n')
+                self.n_listings_csv += 1
+
+    ## the columnar snapshot keeps one small ListingTable per page and is written once at the end
+    def add_listings_columnar(self, listings: list[Listing]):
+        self.tables.append(ListingTable.from_listings(listings))
+        self.ids += [listing.listing.id for listing in listings]
+        self.hrefs += [listing.link.href for listing in listings]
 
     def create_directory_structure(self):
         if not os.path.isdir('data'):
             os.mkdir('data')
             logging.info('"data" folder created')
         if not os.path.isdir(f'data/{self.subfolder_name}'):
-            os.mkdir(f'data/{self.subfolder_name}')
+            os.makedirs(f'data/{self.subfolder_name}')
             logging.info(f'"data/{self.subfolder_name}" folder created')
 
     def save_json_listings(self):
-        self.create_directory_structure()
-        with open(f'data/{self.subfolder_name}/listings.json', 'w', encoding='utf-8') as json_file:
-            json_file.write(json.dumps(self.listings_json, indent=4))
-            logging.info('The JSON file "listings.json" has been saved successfully')
+        if self.json_file is None:
+            self.add_listings_json([])
+        self.json_file.write('\n]' if self.n_listings_json > 0 else ']')
+        self.close_output(self.json_file, 'listings.json')
+        self.json_file = None
+        logging.info(f'The JSON file "listings.json" has been saved successfully with {self.n_listings_json} listings')
 
-    def save_csv_listings(self, base_url: str):
-        self.create_directory_structure()
-        with open(f'data/{self.subfolder_name}/listings.csv', 'w', encoding='utf-8') as csv_file:
-            for i, listing in enumerate(self.listings_csv):
-                if i == 0:
-                    csv_file.write(listing.get_csv_headers() + '\n')
-                line = listing.get_csv_line(base_url)
-                if line is not None:
-                    csv_file.write(line + '\n')
+    def save_jsonl_listings(self):
+        if self.jsonl_file is None:
+            self.add_listings_jsonl([])
+        self.close_output(self.jsonl_file, 'listings.jsonl.gz')
+        self.jsonl_file = None
+        logging.info(f'The JSONL file "listings.jsonl.gz" has been saved successfully with {self.n_listings_jsonl} listings')
+
+    def save_csv_listings(self):
+        if self.csv_file is None:
+            self.add_listings_csv([], '')
+        self.close_output(self.csv_file, 'listings.csv')
+        self.csv_file = None
+        logging.info(f'The CSV file "listings.csv" has been saved successfully with {self.n_listings_csv} listings')
+
+    ## read it back with ListingTable.load('data/<timestamp>/listings.npz')
+    def save_columnar_listings(self):
+        table = ListingTable.concat(self.tables)
+        file = self.open_output('listings.npz', binary=True)
+        table.save(file, id=np.array(self.ids, dtype=str), href=np.array(self.hrefs, dtype=str))
+        self.close_output(file, 'listings.npz')
+        logging.info(f'The columnar file "listings.npz" has been saved successfully with {len(table)} listings')
+        self.tables = []
+        self.ids = []
+        self.hrefs = []
@@ -0,0 +1,67 @@
+import gzip
+import json
+import logging
+import os
+from typing import Iterator
+
+from misc.metrics import metrics
+from model.listing_model import Listing
+
+logger = logging.getLogger(__name__)
+
+
+## a data/<timestamp>/ folder written by SaveData. The raw listings of listings.jsonl.gz or listings.json
+## are enough to rebuild every other output without touching the network
+class Snapshot:
+    listing_files = ('listings.jsonl.gz', 'listings.json')
+
+    def __init__(self, path: str):
+        self.path = path
+        self.listing_file = next((os.path.join(path, file_name) for file_name in self.listing_files
+                                  if os.path.isfile(os.path.join(path, file_name))), None)
+        if self.listing_file is None:
+            logger.error(f'Snapshot "{path}" has no {" or ".join(self.listing_files)}, enable save_jsonl_listings '
+                         f'or save_json_listings to render from it')
+            raise Exception(f'Snapshot "{path}" has no {" or ".join(self.listing_files)}')
+
+    ## the most recent snapshot with raw listings, only the ones of search `search_name` in a batch run
+    @classmethod
+    def find_latest(cls, root: str = 'data', search_name: str = '') -> 'Snapshot':
+        paths = []
+        for directory, _, file_names in os.walk(root):
+            if search_name and os.path.basename(directory) != search_name:
+                continue
+            if any(file_name in file_names for file_name in cls.listing_files):
+                paths.append(os.path.relpath(directory, root))
+        if not paths:
+            logger.error(f'No snapshot with raw listings found in "{root}"')
+            raise Exception(f'No snapshot with raw listings found in "{root}"')
+        ## folders are named yyyymmdd-HHMMSS, so the greatest path is the most recent one
+        return cls(os.path.join(root, max(paths)))
+
+    def iter_listing_json(self, page_size: int = 100) -> Iterator[list[dict]]:
+        if self.listing_file.endswith('.jsonl.gz'):
+            page = []
+            with gzip.open(self.listing_file, 'rt', encoding='utf-8') as file:
+                for line in file:
+                    page.append(json.loads(line))
+                    if len(page) == page_size:
+                        yield page
+                        page = []
+            if page:
+                yield page
+            return
+        with open(self.listing_file, 'r', encoding='utf-8') as file:
+            listing_json = json.load(file)
+        for start in range(0, len(listing_json), page_size):
+            yield listing_json[start:start + page_size]
+
+    def iter_pages(self, page_size: int = 100) -> Iterator[list[Listing]]:
+        n_listings = 0
+        for listing_json in self.iter_listing_json(page_size):
+            with metrics.timer('decode'):
+                listings = [Listing(**listing) for listing in listing_json]
+            metrics.increment('listings_parsed_total', len(listings))
+            n_listings += len(listings)
+            yield listings
+        logger.info(f'Read {n_listings} listings from {self.listing_file}')
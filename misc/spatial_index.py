@@ -0,0 +1,133 @@
+import json
+import logging
+from typing import Any, List
+
+import numpy as np
+from pydantic import TypeAdapter
+
+from model.MarketModel import MarketModel
+from model.listing_model import Listing, Proximity
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_METERS = 6371008.8
+
+
+def haversine(lat1: np.ndarray, lon1: np.ndarray, lat2: np.ndarray, lon2: np.ndarray) -> np.ndarray:
+    lat1, lon1, lat2, lon2 = (np.radians(value) for value in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_METERS * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+## uniform grid over POIs projected to local meters, queries only look at the 3x3 cells around each point
+class PoiIndex:
+    grid_key_offset = 1 << 31
+
+    def __init__(self, pois: list[MarketModel], radius_meters: float = 500, cell_meters: float = 1000):
+        self.radius_meters = radius_meters
+        ## a cell is at least as large as the radius, so every POI within the radius is in the 3x3 neighborhood
+        self.cell_meters = max(cell_meters, radius_meters)
+        lats = np.array([poi.lat for poi in pois], dtype=float)
+        lons = np.array([poi.lon for poi in pois], dtype=float)
+        self.reference_lat = float(lats.mean()) if len(pois) else 0.0
+        keys = self.get_cell_keys(lats, lons)
+        order = np.argsort(keys, kind='stable')
+        self.keys = keys[order]
+        self.lats = lats[order]
+        self.lons = lons[order]
+        self.names = [pois[i].name for i in order]
+        logger.info(f'POI index built with {len(pois)} points and {len(np.unique(self.keys))} cells of {self.cell_meters:.0f} m')
+
+    def __len__(self) -> int:
+        return len(self.lats)
+
+    @classmethod
+    def from_json_files(cls, paths: list[str], radius_meters: float = 500) -> 'PoiIndex':
+        type_adapter = TypeAdapter(List[MarketModel])
+        pois = []
+        for path in paths:
+            with open(path, 'r', encoding='utf-8') as file:
+                pois += type_adapter.validate_python(json.load(file))
+        return cls(pois, radius_meters)
+
+    @classmethod
+    def from_config(cls, utilities: Any) -> 'PoiIndex | None':
+        paths = [path.strip() for path in utilities.get('poi_files', '').split(',') if path.strip()]
+        if not paths:
+            return None
+        return cls.from_json_files(paths, float(utilities.get('poi_radius_meters', '500')))
+
+    def get_cells(self, lats: np.ndarray, lons: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        y = np.radians(lats) * EARTH_RADIUS_METERS
+        x = np.radians(lons) * EARTH_RADIUS_METERS * np.cos(np.radians(self.reference_lat))
+        ## 5% of slack absorbs the error of the local projection against the haversine distance
+        cell_size = self.cell_meters * 1.05
+        return np.floor(x / cell_size).astype(np.int64), np.floor(y / cell_size).astype(np.int64)
+
+    def get_cell_keys(self, lats: np.ndarray, lons: np.ndarray, dx: int = 0, dy: int = 0) -> np.ndarray:
+        cell_x, cell_y = self.get_cells(lats, lons)
+        return (cell_x + dx) * self.grid_key_offset + (cell_y + dy)
+
+    ## returns, for each point, the distance to and index of the nearest POI and the count of POIs within the radius
+    def query(self, lats: np.ndarray, lons: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        n_points = len(lats)
+        nearest_distance = np.full(n_points, np.inf)
+        nearest_index = np.full(n_points, -1, dtype=np.int64)
+        within_radius = np.zeros(n_points, dtype=np.int64)
+        if n_points == 0 or len(self) == 0:
+            return nearest_distance, nearest_index, within_radius
+
+        valid = ~(np.isnan(lats) | np.isnan(lons))
+        point_ids = np.flatnonzero(valid)
+        point_lats, point_lons = lats[valid], lons[valid]
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                keys = self.get_cell_keys(point_lats, point_lons, dx, dy)
+                starts = np.searchsorted(self.keys, keys, side='left')
+                counts = np.searchsorted(self.keys, keys, side='right') - starts
+                n_pairs = int(counts.sum())
+                if n_pairs == 0:
+                    continue
+                ## expand every (point, candidate POI) pair of this neighbor cell without Python loops
+                pair_points = np.repeat(np.arange(len(point_ids)), counts)
+                pair_pois = np.repeat(starts - (np.cumsum(counts) - counts), counts) + np.arange(n_pairs)
+                distances = haversine(point_lats[pair_points], point_lons[pair_points],
+                                      self.lats[pair_pois], self.lons[pair_pois])
+                self.update_nearest(nearest_distance, nearest_index, point_ids[pair_points], pair_pois, distances)
+                within_radius += np.bincount(point_ids[pair_points[distances <= self.radius_meters]], minlength=n_points)
+
+        ## a nearest POI farther than one cell may live outside the 3x3 neighborhood, those points are brute-forced
+        unresolved = np.flatnonzero(valid & (nearest_distance > self.cell_meters))
+        for chunk in np.array_split(unresolved, max(len(unresolved) * len(self) // 1_000_000, 1)):
+            if len(chunk) == 0:
+                continue
+            distances = haversine(lats[chunk, None], lons[chunk, None], self.lats[None, :], self.lons[None, :])
+            nearest_index[chunk] = distances.argmin(axis=1)
+            nearest_distance[chunk] = distances[np.arange(len(chunk)), nearest_index[chunk]]
+        return nearest_distance, nearest_index, within_radius
+
+    @staticmethod
+    def update_nearest(nearest_distance: np.ndarray, nearest_index: np.ndarray, points: np.ndarray,
+                       pois: np.ndarray, distances: np.ndarray):
+        order = np.lexsort((distances, points))
+        points, pois, distances = points[order], pois[order], distances[order]
+        first = np.ones(len(points), dtype=bool)
+        first[1:] = points[1:] != points[:-1]
+        points, pois, distances = points[first], pois[first], distances[first]
+        closer = distances < nearest_distance[points]
+        nearest_distance[points[closer]] = distances[closer]
+        nearest_index[points[closer]] = pois[closer]
+
+    def annotate(self, listings: list[Listing]):
+        lats = np.full(len(listings), np.nan)
+        lons = np.full(len(listings), np.nan)
+        for i, listing in enumerate(listings):
+            address_point = listing.get_address_point()
+            if address_point is not None:
+                lats[i], lons[i] = address_point.get_lat_lon()
+        nearest_distance, nearest_index, within_radius = self.query(lats, lons)
+        for listing, distance, index, count in zip(listings, nearest_distance, nearest_index, within_radius):
+            if index < 0:
+                listing.proximity = None
+                continue
+            listing.proximity = Proximity(self.names[index], float(distance), int(count), self.radius_meters)
@@ -24,4 +24,15 @@ class URLParser:
         if not add_if_not_exist:
             params = {key: value for key, value in params.items() if key in query}
         query.update(params)
-        self.parsed = self.parsed._replace(query=urlencode(query))
\ No newline at end of file
+        self.parsed = self.parsed._replace(query=urlencode(query))
+
+    def remove_query_params(self, names: set | tuple):
+        query = [(key, value) for key, value in parse_qsl(self.parsed.query) if key not in names]
+        self.parsed = self.parsed._replace(query=urlencode(query))
+
+    def get_query_params(self) -> dict:
+        return dict(parse_qsl(self.parsed.query))
+
+    def get_normalized_url(self, ignored_params: set | tuple = ()) -> str:
+        query = sorted((key, value) for key, value in parse_qsl(self.parsed.query) if key not in ignored_params)
+        return self.parsed._replace(query=urlencode(query)).geturl()
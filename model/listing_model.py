@@ -1,17 +1,18 @@
+from dataclasses import field
 from datetime import datetime
 from typing import Optional
 
-from pydantic import ConfigDict
+from pydantic import ConfigDict, TypeAdapter
 from pydantic.dataclasses import dataclass
 
 
-@dataclass
+@dataclass(slots=True)
 class RentalInfo:
     period: Optional[str] = "Not specified"
     warranties: Optional[list[str]] = ()
 
 
-@dataclass(config=ConfigDict(extra='ignore'))
+@dataclass(config=ConfigDict(extra='ignore'), slots=True)
 class PricingInfo:
     rentalInfo: Optional[RentalInfo] = None
     businessType: str = "Not defined"
@@ -24,12 +25,12 @@ class PricingInfo:
         return f"Aluguel: R${self.price:.2f}<br>Condomínio: R${self.monthlyCondoFee:.2f}<br>IPTU: R${self.yearlyIptu:.2f}"
 
 
-@dataclass(config=ConfigDict(extra='ignore'))
+@dataclass(config=ConfigDict(extra='ignore'), slots=True)
 class AdvertiserContact:
     phones: list[str] = ()
 
 
-@dataclass(config=ConfigDict(extra='ignore'))
+@dataclass(config=ConfigDict(extra='ignore'), slots=True)
 class AddressPoint:
     lat: float = 0
     lon: float = 0
@@ -46,7 +47,7 @@ class AddressPoint:
         return self.lat, self.lon
 
 
-@dataclass(config=ConfigDict(extra='ignore'))
+@dataclass(config=ConfigDict(extra='ignore'), slots=True)
 class Address:
     point: Optional[AddressPoint] = None
     city: str = "Not informed"
@@ -62,8 +63,9 @@ class Address:
             return f'{self.street} {self.streetNumber}, {self.neighborhood}, {self.city}/{self.stateAcronym}'
 
 
-@dataclass(config=ConfigDict(extra='ignore'))
+@dataclass(config=ConfigDict(extra='ignore'), slots=True)
 class ListingModel:
+    id: str = "Not informed"
     updatedAt: Optional[datetime] = None
     address: Optional[Address] = None
     contractType: str = "Not informed"
@@ -83,32 +85,98 @@ class ListingModel:
     pricingInfos: list[PricingInfo] = ()
     unitFloor: int = 0
 
+    ## derived from pricingInfos once at validation time, it is read several times per listing
+    rentalPricingInfo: Optional[PricingInfo] = field(default=None, init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        self.rentalPricingInfo = next((p for p in self.pricingInfos if p.businessType == 'RENTAL'), None)
+
     def get_rental_pricing_info(self) -> PricingInfo | None:
-        rent = list(filter(lambda p: p.businessType == 'RENTAL', self.pricingInfos))
-        if len(rent) > 0:
-            return rent[0]
-        return None
+        return self.rentalPricingInfo
 
 
-@dataclass(config=ConfigDict(extra='ignore'))
+@dataclass(config=ConfigDict(extra='ignore'), slots=True)
 class Link:
     href: str = "Not informed"
 
 
-@dataclass(config=ConfigDict(extra='ignore'))
+@dataclass(config=ConfigDict(extra='ignore'), slots=True)
 class Account:
     name: str = "Not informed"
     licenseNumber: str = "Not informed"
 
 
-@dataclass(config=ConfigDict(extra='ignore'))
+@dataclass(slots=True)
+class Proximity:
+    nearestName: str
+    nearestDistance: float
+    countWithinRadius: int
+    radius: float
+
+    def get_proximity_description(self):
+        return (f"Ponto de interesse mais próximo: {self.nearestName} ({self.nearestDistance:.0f} m)<br>"
+                f"Pontos de interesse em {self.radius:.0f} m: {self.countWithinRadius}")
+
+
+## other ads of the same property, collapsed into the canonical listing by ListingDeduplicator
+@dataclass(slots=True)
+class Duplicates:
+    hrefs: list[str]
+    advertisers: list[str]
+    priceMin: float
+    priceMax: float
+
+    def get_duplicates_description(self, base_url: str):
+        links = '<br>'.join(f'<a href="{base_url + href}">{advertiser}</a>' for href, advertiser in zip(self.hrefs, self.advertisers))
+        return f"Aluguel entre R${self.priceMin:.2f} e R${self.priceMax:.2f} em {len(self.hrefs) + 1} anúncios<br>Outros anúncios:<br>{links}"
+
+
+## compares a listing with the previous run of the same search, see HistoryStore.annotate
+@dataclass(slots=True)
+class PriceChange:
+    previousPrice: Optional[float]
+    price: Optional[float]
+
+    def is_new(self) -> bool:
+        return self.previousPrice is None
+
+    def get_change_description(self):
+        if self.is_new():
+            return "Novo anúncio desde a última busca"
+        return f"Aluguel reduzido de R${self.previousPrice:.2f} para R${self.price:.2f}"
+
+
+@dataclass(config=ConfigDict(extra='ignore'), slots=True)
 class Listing:
     listing: Optional[ListingModel] = None
     link: Optional[Link] = None
     account: Optional[Account] = None
 
+    ## filled by PoiIndex.annotate, it is not part of the API payload
+    proximity: Optional[Proximity] = field(default=None, init=False, repr=False, compare=False)
+    ## filled by HistoryStore.annotate for new listings and price drops
+    priceChange: Optional[PriceChange] = field(default=None, init=False, repr=False, compare=False)
+    ## filled by ListingDeduplicator on the listing kept for a group of duplicated ads
+    duplicates: Optional[Duplicates] = field(default=None, init=False, repr=False, compare=False)
+
     kml_icon = 'http://maps.google.com/mapfiles/kml/paddle/grn-blank.png'
     kml_icon_color = 'ff31b87c'
+    kml_icon_new = 'http://maps.google.com/mapfiles/kml/paddle/ylw-stars.png'
+    kml_icon_new_color = 'ff00d7ff'
+    kml_icon_price_drop = 'http://maps.google.com/mapfiles/kml/paddle/red-diamond.png'
+    kml_icon_price_drop_color = 'ff3c14dc'
+
+    @classmethod
+    def get_kml_icons(cls) -> list[tuple[str, str]]:
+        return [(cls.kml_icon, cls.kml_icon_color), (cls.kml_icon_new, cls.kml_icon_new_color),
+                (cls.kml_icon_price_drop, cls.kml_icon_price_drop_color)]
+
+    def get_kml_icon(self) -> tuple[str, str]:
+        if self.priceChange is None:
+            return self.kml_icon, self.kml_icon_color
+        if self.priceChange.is_new():
+            return self.kml_icon_new, self.kml_icon_new_color
+        return self.kml_icon_price_drop, self.kml_icon_price_drop_color
 
     def get_address_point(self) -> AddressPoint | None:
         listing_obj = self.listing
@@ -137,18 +205,62 @@ class Listing:
             'Condomínio',
             'IPTU',
             'Link',
+            'Ponto de interesse mais próximo',
+            'Distância (m)',
+            'Pontos de interesse no raio',
+            'Outros anúncios',
+            'Aluguel mínimo',
+            'Aluguel máximo',
         ])
 
     def get_csv_line(self, base_url: str, separator: str = ';'):
-        if self.listing.get_rental_pricing_info() is None:
+        rent = self.listing.get_rental_pricing_info()
+        if rent is None:
             return None
         return separator.join([
             self.listing.title,
             self.listing.address.get_address(),
             str(self.listing.usableAreas[0]),
             self.get_contact_info(),
-            str(int(self.listing.get_rental_pricing_info().price)),
-            str(int(self.listing.get_rental_pricing_info().monthlyCondoFee)),
-            str(int(self.listing.get_rental_pricing_info().yearlyIptu)),
-            base_url + self.link.href
+            str(int(rent.price)),
+            str(int(rent.monthlyCondoFee)),
+            str(int(rent.yearlyIptu)),
+            base_url + self.link.href,
+            self.proximity.nearestName if self.proximity is not None else '',
+            str(int(self.proximity.nearestDistance)) if self.proximity is not None else '',
+            str(self.proximity.countWithinRadius) if self.proximity is not None else '',
+            ' '.join(base_url + href for href in self.duplicates.hrefs) if self.duplicates is not None else '',
+            str(int(self.duplicates.priceMin)) if self.duplicates is not None else '',
+            str(int(self.duplicates.priceMax)) if self.duplicates is not None else '',
         ])
+
+
+@dataclass(config=ConfigDict(extra='ignore'), slots=True)
+class SearchResult:
+    listings: list[Listing] = ()
+
+
+@dataclass(config=ConfigDict(extra='ignore'), slots=True)
+class Search:
+    result: SearchResult
+
+
+@dataclass(config=ConfigDict(extra='ignore'), slots=True)
+class UriPagination:
+    totalListingCounter: int = 0
+
+
+@dataclass(config=ConfigDict(extra='ignore'), slots=True)
+class Page:
+    uriPagination: UriPagination
+
+
+## envelope of a glue-api response, only the parts read by ZapRequest are declared
+@dataclass(config=ConfigDict(extra='ignore'), slots=True)
+class SearchResponse:
+    search: Search
+    page: Page
+
+
+## building a TypeAdapter is expensive, it is created once and shared
+search_response_adapter = TypeAdapter(SearchResponse)
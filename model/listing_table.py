@@ -0,0 +1,118 @@
+import logging
+from math import ceil
+from typing import Iterable
+
+import numpy as np
+
+from model.listing_model import Listing
+
+logger = logging.getLogger(__name__)
+
+
+class ListingTable:
+    float_columns = ('price', 'condo_fee', 'yearly_iptu', 'total_monthly_cost', 'usable_area', 'bedrooms', 'lat', 'lon',
+                     'nearest_poi_distance')
+
+    def __init__(self, columns: dict[str, np.ndarray], neighborhoods: list[str], amenities: list[str]):
+        self.columns = columns
+        ## neighborhood_code indexes `neighborhoods`, bit i of amenity_mask (word i // 64) is `amenities[i]`
+        self.neighborhoods = neighborhoods
+        self.amenities = amenities
+
+    def __len__(self) -> int:
+        return len(self.columns['price'])
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.columns[name]
+
+    @classmethod
+    def from_listings(cls, listings: list[Listing]) -> 'ListingTable':
+        n_listings = len(listings)
+        columns = {name: np.full(n_listings, np.nan) for name in cls.float_columns}
+        columns['has_rent'] = np.zeros(n_listings, dtype=bool)
+        columns['floor'] = np.zeros(n_listings, dtype=np.int32)
+        columns['pois_within_radius'] = np.zeros(n_listings, dtype=np.int32)
+        neighborhood_codes = np.zeros(n_listings, dtype=np.int32)
+        neighborhoods = {}
+        amenities = {}
+        listing_amenities = []
+
+        for i, listing in enumerate(listings):
+            listing_model = listing.listing
+            rent = listing_model.get_rental_pricing_info()
+            if rent is not None:
+                columns['has_rent'][i] = True
+                columns['price'][i] = rent.price
+                columns['condo_fee'][i] = rent.monthlyCondoFee
+                columns['yearly_iptu'][i] = rent.yearlyIptu
+                columns['total_monthly_cost'][i] = rent.price + rent.monthlyCondoFee + rent.yearlyIptu / 12
+            if listing_model.usableAreas:
+                columns['usable_area'][i] = listing_model.usableAreas[0]
+            if listing_model.bedrooms:
+                columns['bedrooms'][i] = listing_model.bedrooms[0]
+            columns['floor'][i] = listing_model.unitFloor
+            address_point = listing.get_address_point()
+            if address_point is not None:
+                columns['lat'][i], columns['lon'][i] = address_point.get_lat_lon()
+            if listing.proximity is not None:
+                columns['nearest_poi_distance'][i] = listing.proximity.nearestDistance
+                columns['pois_within_radius'][i] = listing.proximity.countWithinRadius
+            neighborhood = listing_model.address.neighborhood if listing_model.address is not None else ''
+            neighborhood_codes[i] = neighborhoods.setdefault(neighborhood, len(neighborhoods))
+            listing_amenities.append([amenities.setdefault(amenity, len(amenities)) for amenity in listing_model.amenities])
+
+        amenity_mask = np.zeros((n_listings, max(ceil(len(amenities) / 64), 1)), dtype=np.uint64)
+        for i, bits in enumerate(listing_amenities):
+            for bit in bits:
+                amenity_mask[i, bit // 64] |= np.uint64(1 << (bit % 64))
+        columns['neighborhood_code'] = neighborhood_codes
+        columns['amenity_mask'] = amenity_mask
+        return cls(columns, list(neighborhoods), list(amenities))
+
+    ## codes and bits of each table are remapped to the merged vocabularies
+    @classmethod
+    def concat(cls, tables: Iterable['ListingTable']) -> 'ListingTable':
+        tables = [table for table in tables if len(table) > 0]
+        if not tables:
+            return cls.from_listings([])
+        neighborhoods = list(dict.fromkeys(name for table in tables for name in table.neighborhoods))
+        amenities = list(dict.fromkeys(name for table in tables for name in table.amenities))
+        neighborhood_index = {name: code for code, name in enumerate(neighborhoods)}
+
+        columns = {
+            name: np.concatenate([table[name] for table in tables])
+            for name in tables[0].columns if name not in ('neighborhood_code', 'amenity_mask')
+        }
+        columns['neighborhood_code'] = np.concatenate([
+            np.array([neighborhood_index[name] for name in table.neighborhoods], dtype=np.int32)[table['neighborhood_code']]
+            for table in tables
+        ])
+        amenity_mask = np.zeros((len(columns['price']), max(ceil(len(amenities) / 64), 1)), dtype=np.uint64)
+        for bit, amenity in enumerate(amenities):
+            has_amenity = np.concatenate([table.has_amenity(amenity) for table in tables])
+            amenity_mask[:, bit // 64] |= has_amenity.astype(np.uint64) << np.uint64(bit % 64)
+        columns['amenity_mask'] = amenity_mask
+        return cls(columns, neighborhoods, amenities)
+
+    def has_amenity(self, amenity: str) -> np.ndarray:
+        if amenity not in self.amenities:
+            return np.zeros(len(self), dtype=bool)
+        bit = self.amenities.index(amenity)
+        word = self.columns['amenity_mask'][:, bit // 64]
+        return (word & np.uint64(1 << (bit % 64))) != 0
+
+    def is_neighborhood(self, neighborhood: str) -> np.ndarray:
+        if neighborhood not in self.neighborhoods:
+            return np.zeros(len(self), dtype=bool)
+        return self.columns['neighborhood_code'] == self.neighborhoods.index(neighborhood)
+
+    ## the vocabularies are stored next to the columns, so a snapshot is read back without parsing any JSON
+    def save(self, file, **extra_columns: np.ndarray):
+        np.savez_compressed(file, neighborhoods=np.array(self.neighborhoods, dtype=str),
+                            amenities=np.array(self.amenities, dtype=str), **self.columns, **extra_columns)
+
+    @classmethod
+    def load(cls, path: str) -> 'ListingTable':
+        with np.load(path) as snapshot:
+            columns = {name: snapshot[name] for name in snapshot.files if name not in ('neighborhoods', 'amenities')}
+            return cls(columns, snapshot['neighborhoods'].tolist(), snapshot['amenities'].tolist())